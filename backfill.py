@@ -0,0 +1,120 @@
+# backfill.py
+# Offline backfill: ingests a directory of bulletin PDFs (eg: data/ or an archive of several years of bulletins)
+# without the Harti website. The PDFs are extracted and transformed in a process pool (one worker per core by default)
+# and every transformed bulletin is written to the selected local sinks (see src/connector/sinks.py).
+#
+# usage (from the repo root):
+#   python backfill.py data/                                          monthly CSV files in backfill_output/csv
+#   python backfill.py archive/ --sink csv --sink parquet --output-dir out --report out/backfill_report.json
+#   python backfill.py archive/ --sink emulator                       Azurite + Cosmos DB emulator
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from src.logHandling import start_worker_log_listener
+from src.connector.sinks import SINKS, get_sinks
+from src.pipeline2.pdf_processing import extract_and_transform_pdf_with_metrics, init_worker
+
+warnings.filterwarnings('ignore')
+
+def find_pdfs(paths):
+    """Returns the PDF files of the given files / directories (searched recursively), sorted and without duplicates
+    """
+    pdf_paths = set()
+    for path in paths:
+        if os.path.isdir(path):
+            pdf_paths.update(glob.glob(os.path.join(path, '**', '*.pdf'), recursive=True))
+        else:
+            pdf_paths.add(path)
+    return sorted(pdf_paths)
+
+def write_to_sinks(sinks, food_df):
+    errors = []
+    for sink in sinks:
+        try:
+            sink.write(food_df)
+        except Exception as e:
+            errors.append(f"{sink.name} sink: {e}")
+    return errors
+
+def backfill(pdf_paths, sinks, workers=None):
+    """
+    Extracts and transforms pdf_paths in a process pool and writes every bulletin to the sinks as soon as it is done.
+
+    Parameters:
+    - pdf_paths: PDF files to ingest.
+    - sinks: BulletinSink objects, see src/connector/sinks.py.
+    - workers: Number of worker processes (default: number of cores).
+
+    Returns:
+    - One status dict per file (file, status 'ok' / 'no_table' / 'failed', rows, seconds, error), in the order of pdf_paths.
+    """
+    statuses = {}
+    log_queue = multiprocessing.Queue()
+    log_listener = start_worker_log_listener(log_queue)
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=init_worker, initargs=(log_queue,)) as process_pool:
+            # the workers read the files themselves, so only the path is sent to them
+            futures = {process_pool.submit(extract_and_transform_pdf_with_metrics, pdf_path, pdf_path): pdf_path for pdf_path in pdf_paths}
+            for future in as_completed(futures):
+                pdf_path = futures[future]
+                status = {'file': pdf_path, 'status': 'ok', 'rows': 0, 'seconds': None, 'error': None}
+                try:
+                    food_df, metrics = future.result()
+                    status['seconds'] = round(sum(record['wall_seconds'] for record in metrics['stages']), 3)
+                    if food_df is None:
+                        status['status'] = 'no_table'
+                    else:
+                        status['rows'] = len(food_df)
+                        errors = write_to_sinks(sinks, food_df)
+                        if errors:
+                            status['status'], status['error'] = 'failed', '; '.join(errors)
+                except Exception as e:
+                    status['status'], status['error'] = 'failed', str(e)
+                statuses[pdf_path] = status
+                logging.info(f"Backfill {len(statuses)}/{len(pdf_paths)} {pdf_path}: {status['status']}"
+                             + (f" ({status['error']})" if status['error'] else f" ({status['rows']} rows)"))
+    finally:
+        log_listener.stop()
+        for sink in sinks:
+            sink.close()
+    return [statuses[pdf_path] for pdf_path in pdf_paths]
+
+def print_report(statuses, seconds):
+    print(f"{'file':<50} {'status':<9} {'rows':>6}  error")
+    for status in statuses:
+        print(f"{status['file']:<50} {status['status']:<9} {status['rows']:>6}  {status['error'] or ''}")
+    counts = {}
+    for status in statuses:
+        counts[status['status']] = counts.get(status['status'], 0) + 1
+    print(f"{len(statuses)} files in {seconds:.1f}s ({len(statuses) / seconds:.2f} files/s): "
+          + ', '.join(f"{count} {name}" for name, count in sorted(counts.items())))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Ingest a directory of bulletin PDFs into local sinks, without the Harti website')
+    parser.add_argument('paths', nargs='+', help='PDF files or directories (searched recursively)')
+    parser.add_argument('--sink', action='append', choices=sorted(SINKS), help='output (repeatable, default: csv)')
+    parser.add_argument('--output-dir', help='directory of the file sinks (default: backfill_csv_dir / backfill_parquet_dir)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: number of cores)')
+    parser.add_argument('--report', help='write the per file status as JSON to this file')
+    args = parser.parse_args()
+
+    pdf_paths = find_pdfs(args.paths)
+    if not pdf_paths:
+        sys.exit(f"No PDF files found in {args.paths}")
+
+    start = time.perf_counter()
+    statuses = backfill(pdf_paths, get_sinks(args.sink or ['csv'], args.output_dir), args.workers)
+    print_report(statuses, time.perf_counter() - start)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(statuses, f, indent=2)
+    if any(status['status'] == 'failed' for status in statuses):
+        sys.exit(1)
@@ -0,0 +1,73 @@
+# clean_values_benchmark.py
+# Microbenchmark of the numeric cleaning step: clean_values applied cell by cell (the old apply_cleaning_to_dataframe)
+# against the vectorized clean_column, on the raw wholesale tables of the bulletins in data/ and on a synthetic
+# backfill sized table. Also checks that both give the same output (apart from NaN, which clean_column keeps).
+#
+# usage (from the repo root): python -m benchmarks.clean_values_benchmark [--repeat N] [--rows N]
+import argparse
+import glob
+import timeit
+import warnings
+import numpy as np
+import pandas as pd
+from src.pipeline2.cleaning_column_values import clean_values, clean_column
+
+warnings.filterwarnings('ignore')
+
+def load_bulletin_tables():
+    from src.pipeline2.get_pdfdata import BulletinPdf
+    from src.pipeline2.extract_table_from_pdf_to_df import get_table_extraction_engine
+    from src.pipeline2.meta_data_checker import locate_wholesale_table_page
+
+    engine = get_table_extraction_engine()
+    engine.start()
+    tables = []
+    for pdf_path in sorted(glob.glob('data/*.pdf')):
+        with BulletinPdf(pdf_path) as pdf:
+            tables.append(engine.extract(pdf, locate_wholesale_table_page(pdf)))
+    return tables
+
+def synthetic_table(rows, columns=12, seed=0):
+    # mix of the cell shapes seen in the bulletins: ranges, fused ranges, floats, blanks and stray text
+    random = np.random.default_rng(seed)
+    shapes = np.array(['350-400', '350400', '1,250.00', ' 95 - 110 ', 'n.a', 'Rs. 420', '-', '12.5'], dtype=object)
+    data = {'Item': [f'Item {i}' for i in range(rows)]}
+    for column in range(columns):
+        values = shapes[random.integers(0, len(shapes), rows)].copy()
+        values[random.random(rows) < 0.1] = np.nan
+        data[f'Market {column}'] = values
+    return pd.DataFrame(data)
+
+def old_cleaning(df):
+    return {column: df[column].apply(clean_values) for column in df.columns[1:]}
+
+def new_cleaning(df):
+    return {column: clean_column(df[column]) for column in df.columns[1:]}
+
+def same_output(df):
+    old, new = old_cleaning(df), new_cleaning(df)
+    for column in old:
+        missing = df[column].isna()
+        if not old[column][~missing].equals(new[column][~missing]) or not new[column][missing].isna().all():
+            return False
+    return True
+
+def run(name, df, repeat):
+    old_seconds = min(timeit.repeat(lambda: old_cleaning(df), number=1, repeat=repeat))
+    new_seconds = min(timeit.repeat(lambda: new_cleaning(df), number=1, repeat=repeat))
+    print(f"{name:<30} {df.size:>9} cells  clean_values {old_seconds * 1e3:8.2f} ms  clean_column {new_seconds * 1e3:8.2f} ms  "
+          f"x{old_seconds / new_seconds:5.1f}  same output: {same_output(df)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=100_000, help='rows of the synthetic table')
+    parser.add_argument('--skip-pdfs', action='store_true', help='only run the synthetic table (no Java / PDF parsing needed)')
+    args = parser.parse_args()
+
+    if not args.skip_pdfs:
+        tables = load_bulletin_tables()
+        for pdf_path, table in zip(sorted(glob.glob('data/*.pdf')), tables):
+            run(pdf_path, table, args.repeat)
+        run('all bulletins', pd.concat(tables, ignore_index=True), args.repeat)
+    run(f'synthetic ({args.rows} rows)', synthetic_table(args.rows), args.repeat)
@@ -0,0 +1,252 @@
+# pipeline_benchmark.py
+# Reproducible benchmark of every pipeline stage on the bulletins in data/: text extraction, page location, table
+# extraction, each data transformation step, the cosmos document build, CSV serialization and the whole offline
+# pipeline (extract_and_transform_pdf + cosmos documents + CSV, without any upload).
+#
+# Every stage is timed --repeat times per bulletin (after a warm up run) and reported as latency percentiles and
+# throughput, together with the peak RSS of the benchmark process. The results can be saved as a JSON baseline and
+# later runs compared against it: the run fails (exit code 1) if the median of a stage, or the peak RSS, regressed
+# by more than --threshold, or if a bulletin that was processed ('ok') in the baseline no longer is.
+# Timings depend on the machine, so no baseline is committed: record one with --save-baseline on the machine that
+# runs --compare.
+#
+# Sockets are disabled for the whole run, so nothing can reach the network (Java / tabula runs in process).
+#
+# usage (from the repo root):
+#   python -m benchmarks.pipeline_benchmark --save-baseline                 record benchmarks/baselines/pipeline.json
+#   python -m benchmarks.pipeline_benchmark --compare [--threshold 0.25]   fail on regressions against it
+import argparse
+import glob
+import json
+import os
+import platform
+import socket
+import sys
+import time
+import warnings
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from src.pipeline2.get_pdfdata import BulletinPdf
+from src.pipeline2.meta_data_checker import locate_wholesale_table_pages
+from src.pipeline2.extract_table_from_pdf_to_df import table_extraction_engine, extract_tables_by_page
+from src.pipeline2.cleaning_column_values import clean_dataframe
+from src.pipeline2.data_transformation import (
+    rename_columns_before_dot,
+    rename_first_column,
+    preprocess_dataframe,
+    convert_dates,
+    transform_food_df,
+    update_item_names,
+    split_and_convert_value_column,
+    insert_database_write_date,
+    drop_rows_with_missing_values_in_value_column,
+    add_page_number_column,
+)
+from src.pipeline2.data_format_converter import convert_dataframe_to_cosmos_format, dataframe_to_csv_string
+from src.pipeline2.pdf_processing import extract_and_transform_pdf
+from src.utils.metrics import peak_rss_mb
+
+warnings.filterwarnings('ignore')
+
+DEFAULT_BASELINE = os.path.join('benchmarks', 'baselines', 'pipeline.json')
+
+# the per page steps of transform_page_table and the row wise steps of extract_and_transform_pdf, in pipeline order
+PAGE_STEPS = [clean_dataframe, rename_columns_before_dot, rename_first_column, preprocess_dataframe, convert_dates, transform_food_df]
+ROW_STEPS = [update_item_names, split_and_convert_value_column, insert_database_write_date, drop_rows_with_missing_values_in_value_column, add_page_number_column]
+
+def forbid_network():
+    def refuse(*args, **kwargs):
+        raise RuntimeError("pipeline_benchmark runs offline, a network connection was attempted")
+    socket.socket.connect = refuse
+    socket.socket.connect_ex = refuse
+    socket.create_connection = refuse
+
+class StageTimings:
+    """Latencies (seconds) and processed units (rows or bytes) of every stage, in the order the stages were first timed"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, stage, function, *args, units=None, repeat=1):
+        """Runs function(*args) once as warm up and repeat times timed. The arguments are copied before every run,
+        since several steps modify their input DataFrame. Returns the result of the last run.
+        units: the units processed per run, as a count of rows, a (count, unit name) tuple or a function of the
+        result returning either (default: len of the result, in rows).
+        """
+        result = function(*copy_arguments(args))
+        latencies = []
+        for _ in range(repeat):
+            arguments = copy_arguments(args)
+            start = time.perf_counter()
+            result = function(*arguments)
+            latencies.append(time.perf_counter() - start)
+        record = self.samples.setdefault(stage, {'latencies': [], 'units': 0, 'unit': 'rows'})
+        record['latencies'] += latencies
+        if callable(units):
+            units = units(result)
+        if units is None and hasattr(result, '__len__'):
+            units = len(result)
+        elif isinstance(units, tuple):
+            units, record['unit'] = units
+        record['units'] += (units or 0) * repeat
+        return result
+
+    def summary(self):
+        summary = {}
+        for stage, record in self.samples.items():
+            latencies = np.array(record['latencies'])
+            summary[stage] = {
+                'runs': len(latencies),
+                'p50_ms': float(np.percentile(latencies, 50) * 1e3),
+                'p90_ms': float(np.percentile(latencies, 90) * 1e3),
+                'p99_ms': float(np.percentile(latencies, 99) * 1e3),
+                'max_ms': float(latencies.max() * 1e3),
+                'throughput': record['units'] / latencies.sum() if latencies.sum() else None,
+                'throughput_unit': record['unit'] + '/s',
+            }
+        return summary
+
+def copy_arguments(args):
+    return [arg.copy() if isinstance(arg, pd.DataFrame) else arg for arg in args]
+
+def text_extraction(pdf_content):
+    # the text of the first page, as the metadata check reads it
+    with BulletinPdf(pdf_content) as pdf:
+        return pdf.page_text(1)
+
+def locate_pages(pdf_content):
+    with BulletinPdf(pdf_content) as pdf:
+        return locate_wholesale_table_pages(pdf)
+
+def table_extraction(pdf_content, pages):
+    with BulletinPdf(pdf_content) as pdf:
+        return extract_tables_by_page(pdf, pages)
+
+def table_rows(tables_by_page):
+    return sum(len(table) for table in tables_by_page.values())
+
+def build_cosmos_documents(food_df):
+    return list(convert_dataframe_to_cosmos_format(food_df))
+
+def offline_pipeline(pdf_content, pdf_path):
+    food_df = extract_and_transform_pdf(pdf_content, pdf_path)
+    if food_df is None:
+        return None
+    build_cosmos_documents(food_df)
+    dataframe_to_csv_string(food_df)
+    return food_df
+
+def benchmark_pdf(timings, pdf_path, repeat):
+    with open(pdf_path, 'rb') as f:
+        pdf_content = f.read()
+
+    timings.time('text_extraction', text_extraction, pdf_content, units=(len(pdf_content), 'bytes'), repeat=repeat)
+    pages = timings.time('locate_table', locate_pages, pdf_content, units=(1, 'pdfs'), repeat=repeat)
+    if not pages:
+        return 'wholesale table not found'
+    tables_by_page = timings.time(f'table_extraction_{table_extraction_engine.name}', table_extraction, pdf_content, pages, units=table_rows, repeat=repeat)
+
+    page_dfs = []
+    for page_number, food_df in tables_by_page.items():
+        for step in PAGE_STEPS:
+            food_df = timings.time(step.__name__, step, food_df, repeat=repeat)
+        page_dfs.append(add_page_number_column(food_df, page_number))
+    food_df = pd.concat(page_dfs, ignore_index=True)
+    for step in ROW_STEPS:
+        food_df = timings.time(step.__name__, step, food_df, repeat=repeat)
+
+    timings.time('convert_dataframe_to_cosmos_format', build_cosmos_documents, food_df, repeat=repeat)
+    timings.time('dataframe_to_csv_string', dataframe_to_csv_string, food_df, units=len(food_df), repeat=repeat)
+    timings.time('offline_pipeline', offline_pipeline, pdf_content, pdf_path, units=(1, 'pdfs'), repeat=repeat)
+    return f'ok: {len(food_df)} rows'
+
+def run_benchmark(pdf_paths, repeat):
+    table_extraction_engine.start()
+    timings = StageTimings()
+    pdfs = {}
+    for pdf_path in pdf_paths:
+        try:
+            pdfs[pdf_path] = benchmark_pdf(timings, pdf_path, repeat)
+        except Exception as e:
+            # a bulletin the pipeline cannot process is reported, its remaining stages are left out
+            pdfs[pdf_path] = f'failed: {e}'
+        print(f"{pdf_path}: {pdfs[pdf_path]}", file=sys.stderr)
+
+    return {
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'table_extraction_engine': table_extraction_engine.name,
+        'repeat': repeat,
+        'pdfs': pdfs,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': timings.summary(),
+    }
+
+def print_results(results):
+    print(f"{'stage':<48} {'runs':>5} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'throughput':>20}")
+    for stage, stats in results['stages'].items():
+        throughput = f"{stats['throughput']:.1f} {stats['throughput_unit']}" if stats['throughput'] else '-'
+        print(f"{stage:<48} {stats['runs']:>5} {stats['p50_ms']:>9.2f} {stats['p90_ms']:>9.2f} {stats['p99_ms']:>9.2f} {throughput:>20}")
+    print(f"peak RSS {results['peak_rss_mb']:.1f} MB")
+
+def find_regressions(results, baseline, threshold, noise_floor_ms):
+    """Returns a description of every stage whose median (and the peak RSS) is more than threshold worse than the baseline,
+    and of every bulletin that was processed ('ok') in the baseline but is not anymore (failed / table not found).
+    Stages faster than noise_floor_ms in both runs are ignored, their timings are mostly noise.
+    """
+    regressions = []
+    for pdf_path, status in results['pdfs'].items():
+        baseline_status = baseline['pdfs'].get(pdf_path)
+        if baseline_status is not None and baseline_status.startswith('ok') and not status.startswith('ok'):
+            regressions.append(f"{pdf_path}: {baseline_status} -> {status}")
+    for stage, stats in results['stages'].items():
+        baseline_stats = baseline['stages'].get(stage)
+        if baseline_stats is None:
+            continue
+        old, new = baseline_stats['p50_ms'], stats['p50_ms']
+        if max(old, new) >= noise_floor_ms and new > old * (1 + threshold):
+            regressions.append(f"{stage}: p50 {old:.2f} ms -> {new:.2f} ms (+{(new / old - 1) * 100:.0f}%)")
+    old_rss, new_rss = baseline.get('peak_rss_mb'), results.get('peak_rss_mb')
+    if old_rss and new_rss and new_rss > old_rss * (1 + threshold):
+        regressions.append(f"peak RSS {old_rss:.1f} MB -> {new_rss:.1f} MB (+{(new_rss / old_rss - 1) * 100:.0f}%)")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark every pipeline stage on the bulletins in data/')
+    parser.add_argument('pdfs', nargs='*', help='bulletins to benchmark (default: data/*.pdf)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs of every stage per bulletin')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help=f'baseline JSON file (default: {DEFAULT_BASELINE})')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='compare against the baseline, exit code 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown before a stage counts as a regression (default: 0.25 = 25%%)')
+    parser.add_argument('--noise-floor-ms', type=float, default=5.0, help='stages faster than this are not checked (default: 5 ms)')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+    if args.compare and not args.save_baseline and not os.path.exists(args.baseline):
+        sys.exit(f"No baseline at {args.baseline}, record one on this machine first: "
+                 f"python -m benchmarks.pipeline_benchmark --save-baseline --baseline {args.baseline}")
+
+    forbid_network()
+    results = run_benchmark(args.pdfs or sorted(glob.glob('data/*.pdf')), args.repeat)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold, args.noise_floor_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.threshold:.0%} against {args.baseline}")
@@ -0,0 +1,207 @@
+# startup_benchmark.py
+# Cold start benchmark of the entry point: every scenario runs in a fresh interpreter (python -X importtime), --repeat
+# times, and reports the wall time of the whole process and of its imports, plus an import time profile (the modules
+# with the largest cumulative import time, the same numbers as python -X importtime -c "import main").
+#
+# Scenarios:
+#   import_main      import main (what every run pays before run_main starts)
+#   no_new_pdfs      import main + the modules of a run that finds no new bulletin (listing unchanged / 304)
+#   new_pdfs         import main + every module of a run that processes new bulletins
+#
+# import_main and no_new_pdfs must not load the heavy modules (HEAVY_MODULES), the run fails (exit code 1) if they do.
+# The results can be saved as a JSON baseline and later runs compared against it, like benchmarks/pipeline_benchmark.py.
+# Start up times depend on the machine (disk, python build), so no baseline is committed: record one with
+# --save-baseline on the machine that runs --compare.
+#
+# usage (from the repo root):
+#   python -m benchmarks.startup_benchmark --profile 30                    import time profile of import main
+#   python -m benchmarks.startup_benchmark --save-baseline                 record benchmarks/baselines/startup.json
+#   python -m benchmarks.startup_benchmark --compare [--threshold 0.25]   fail on regressions against it
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+DEFAULT_BASELINE = os.path.join('benchmarks', 'baselines', 'startup.json')
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# only needed once there are new bulletins to process
+HEAVY_MODULES = ['pandas', 'numpy', 'pdfplumber', 'pdfminer', 'PyPDF2', 'tabula', 'jpype', 'azure.cosmos', 'pyarrow', 'bs4']
+
+NO_NEW_PDFS_MODULES = ['src.connector.http_client', 'src.connector.blob', 'src.connector.log_shipping', 'src.pipeline2.link_discovery']
+NEW_PDFS_MODULES = NO_NEW_PDFS_MODULES + [
+    'bs4',
+    'pdfminer.pdfparser',
+    'src.connector.cosmos_db',
+    'src.connector.pdf_cache',
+    'src.connector.processed_pdf_tracker',
+    'src.pipeline2.get_pdfdata',
+    'src.pipeline2.pdf_processing',
+    'src.pipeline2.data_format_converter',
+]
+
+SCENARIOS = {
+    'import_main': (['main'], True),
+    'no_new_pdfs': (['main'] + NO_NEW_PDFS_MODULES, True),
+    'new_pdfs': (['main'] + NEW_PDFS_MODULES, False),
+}
+
+def scenario_code(modules):
+    """The script of a scenario: imports the modules, prints the loaded heavy modules as JSON"""
+    return ("import sys\n"
+            + ''.join(f"import {module}\n" for module in modules)
+            + f"print(__import__('json').dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n")
+
+def parse_importtime(stderr):
+    """
+    Parses the output of python -X importtime.
+
+    Parameters:
+    - stderr: The stderr of the interpreter.
+
+    Returns:
+    - {module: (self us, cumulative us)} of every imported module.
+    - The summed cumulative time (us) of the top level imports.
+    """
+    modules = {}
+    top_level_us = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+        if not name[1:].startswith(' '):
+            top_level_us += int(cumulative_us)
+    return modules, top_level_us
+
+def run_scenario(modules, repeat):
+    """Runs the scenario repeat times (after a warm up run that fills the bytecode cache), each in a fresh interpreter"""
+    code = scenario_code(modules)
+    wall_seconds, import_seconds, profiles = [], [], []
+    for run in range(repeat + 1):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, cwd=REPO_ROOT)
+        wall = time.perf_counter() - start
+        if process.returncode != 0:
+            raise RuntimeError(process.stderr.strip().splitlines()[-1])
+        if run == 0:
+            continue
+        profile, top_level_us = parse_importtime(process.stderr)
+        wall_seconds.append(wall)
+        import_seconds.append(top_level_us / 1e6)
+        profiles.append(profile)
+        heavy_modules = json.loads(process.stdout.strip().splitlines()[-1])
+    return wall_seconds, import_seconds, profiles, heavy_modules
+
+def median_profile(profiles, top):
+    """The top modules by median cumulative import time over the runs"""
+    names = set.intersection(*(set(profile) for profile in profiles))
+    rows = [{'module': name,
+             'self_ms': statistics.median(profile[name][0] for profile in profiles) / 1e3,
+             'cumulative_ms': statistics.median(profile[name][1] for profile in profiles) / 1e3}
+            for name in names]
+    return sorted(rows, key=lambda row: row['cumulative_ms'], reverse=True)[:top]
+
+def run_benchmark(scenarios, repeat, top):
+    results = {
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'scenarios': {},
+    }
+    for name in scenarios:
+        modules, lightweight = SCENARIOS[name]
+        wall_seconds, import_seconds, profiles, heavy_modules = run_scenario(modules, repeat)
+        results['scenarios'][name] = {
+            'modules': modules,
+            'wall_p50_ms': statistics.median(wall_seconds) * 1e3,
+            'wall_max_ms': max(wall_seconds) * 1e3,
+            'import_p50_ms': statistics.median(import_seconds) * 1e3,
+            'module_count': statistics.median(len(profile) for profile in profiles),
+            'heavy_modules': heavy_modules,
+            'must_be_lightweight': lightweight,
+            'profile': median_profile(profiles, top),
+        }
+        print(f"{name}: {statistics.median(wall_seconds) * 1e3:.0f} ms", file=sys.stderr)
+    return results
+
+def print_results(results, profile_rows):
+    print(f"{'scenario':<14} {'wall p50 ms':>12} {'wall max ms':>12} {'imports p50 ms':>15} {'modules':>8}  heavy modules")
+    for name, stats in results['scenarios'].items():
+        print(f"{name:<14} {stats['wall_p50_ms']:>12.1f} {stats['wall_max_ms']:>12.1f} {stats['import_p50_ms']:>15.1f} "
+              f"{stats['module_count']:>8.0f}  {', '.join(stats['heavy_modules']) or '-'}")
+    if profile_rows:
+        for name, stats in results['scenarios'].items():
+            print(f"\nimport time profile of {name} (median of {results['repeat']} runs)")
+            print(f"{'module':<60} {'self ms':>9} {'cumulative ms':>14}")
+            for row in stats['profile'][:profile_rows]:
+                print(f"{row['module']:<60} {row['self_ms']:>9.2f} {row['cumulative_ms']:>14.2f}")
+
+def find_heavy_imports(results):
+    """Returns a description of every lightweight scenario that loaded a heavy module"""
+    return [f"{name} imports {', '.join(stats['heavy_modules'])}"
+            for name, stats in results['scenarios'].items() if stats['must_be_lightweight'] and stats['heavy_modules']]
+
+def find_regressions(results, baseline, threshold, noise_floor_ms):
+    """Returns a description of every scenario whose median wall time is more than threshold worse than the baseline.
+    Differences below noise_floor_ms are ignored, interpreter start up alone varies by a few ms.
+    """
+    regressions = []
+    for name, stats in results['scenarios'].items():
+        baseline_stats = baseline['scenarios'].get(name)
+        if baseline_stats is None:
+            continue
+        old, new = baseline_stats['wall_p50_ms'], stats['wall_p50_ms']
+        if new - old >= noise_floor_ms and new > old * (1 + threshold):
+            regressions.append(f"{name}: wall p50 {old:.1f} ms -> {new:.1f} ms (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the cold start (imports) of the entry point')
+    parser.add_argument('scenarios', nargs='*', help=f'scenarios to run (default: all of {list(SCENARIOS)})')
+    parser.add_argument('--repeat', type=int, default=10, help='fresh interpreters per scenario')
+    parser.add_argument('--profile', type=int, default=15, metavar='N', help='print the N slowest imports of every scenario (0: no profile)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help=f'baseline JSON file (default: {DEFAULT_BASELINE})')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='compare against the baseline, exit code 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown before a scenario counts as a regression (default: 0.25 = 25%%)')
+    parser.add_argument('--noise-floor-ms', type=float, default=20.0, help='slowdowns smaller than this are not checked (default: 20 ms)')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+    unknown_scenarios = sorted(set(args.scenarios) - set(SCENARIOS))
+    if unknown_scenarios:
+        parser.error(f"unknown scenarios {unknown_scenarios}, expected some of {list(SCENARIOS)}")
+    if args.compare and not args.save_baseline and not os.path.exists(args.baseline):
+        sys.exit(f"No baseline at {args.baseline}, record one on this machine first: "
+                 f"python -m benchmarks.startup_benchmark --save-baseline --baseline {args.baseline}")
+
+    results = run_benchmark(args.scenarios or list(SCENARIOS), args.repeat, max(args.profile, 30))
+    print_results(results, args.profile)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+
+    failures = find_heavy_imports(results)
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures += find_regressions(results, baseline, args.threshold, args.noise_floor_ms)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if failures:
+        sys.exit(1)
+    if args.compare:
+        print(f"no regressions beyond {args.threshold:.0%} against {args.baseline}")
@@ -0,0 +1,121 @@
+# table_engine_parity.py
+# Compares the pdfplumber lattice engine against tabula on the bulletins in data/:
+# shape / header / cell parity of the raw page tables, parity of the transformed output, and timings.
+# A bulletin fails if an engine raises or produces no output, if the tables of its wholesale price table page differ
+# in shape or header, or if the transformed outputs differ; the failures are listed at the end and the exit code is 1.
+# Differences on the other pages (rice / Sinhala tables the pipeline never reads) are only reported.
+#
+# usage (from the repo root): python -m benchmarks.table_engine_parity [pdf ...]
+import glob
+import re
+import sys
+import time
+import warnings
+import pandas as pd
+from src.pipeline2.get_pdfdata import BulletinPdf
+from src.pipeline2.meta_data_checker import locate_wholesale_table_pages
+import src.pipeline2.extract_table_from_pdf_to_df as extractor
+from src.pipeline2.extract_table_from_pdf_to_df import get_table_extraction_engine
+from src.pipeline2.pdf_processing import extract_and_transform_pdf
+
+warnings.filterwarnings('ignore')
+
+def normalise(value):
+    # whitespace placement inside a cell differs between the engines and is removed by the cleaning step anyway
+    return None if pd.isna(value) else re.sub(r'\s', '', str(value))
+
+def compare_tables(tabula_df, pdfplumber_df):
+    """Returns (ok, description) of the parity of two raw page tables"""
+    if tabula_df.shape != pdfplumber_df.shape:
+        return False, f"shape differs: tabula {tabula_df.shape}, pdfplumber {pdfplumber_df.shape}"
+    header_diffs = sum(normalise(a) != normalise(b) for a, b in zip(tabula_df.columns, pdfplumber_df.columns))
+    cell_diffs = sum(
+        normalise(a) != normalise(b)
+        for row_a, row_b in zip(tabula_df.itertuples(index=False), pdfplumber_df.itertuples(index=False))
+        for a, b in zip(row_a, row_b)
+    )
+    return header_diffs == 0, f"same shape {tabula_df.shape}, {header_diffs} header diffs, {cell_diffs}/{tabula_df.size} cell diffs"
+
+def describe_output(output):
+    if isinstance(output, Exception):
+        return f"failed ({type(output).__name__}: {output})"
+    return 'no output' if output is None else str(output.shape)
+
+def compare_outputs(tabula_df, pdfplumber_df):
+    """Returns (ok, description) of the parity of the transformed outputs, a failed or missing output is not ok"""
+    if not isinstance(tabula_df, pd.DataFrame) or not isinstance(pdfplumber_df, pd.DataFrame):
+        return False, f"tabula: {describe_output(tabula_df)}, pdfplumber: {describe_output(pdfplumber_df)}"
+    columns = ['Date', 'Location', 'Item_Names', 'Min_Value', 'Max_Value']
+    merged = tabula_df[columns].merge(pdfplumber_df[columns], how='outer', indicator=True)
+    only_tabula = (merged['_merge'] == 'left_only').sum()
+    only_pdfplumber = (merged['_merge'] == 'right_only').sum()
+    return only_tabula == only_pdfplumber == 0, f"{len(tabula_df)} vs {len(pdfplumber_df)} rows, {only_tabula} only in tabula, {only_pdfplumber} only in pdfplumber"
+
+def timed(function, *args):
+    start_time = time.perf_counter()
+    try:
+        result = function(*args)
+    except Exception as e:
+        result = e
+    return result, time.perf_counter() - start_time
+
+def main(pdf_paths):
+    tabula_engine = get_table_extraction_engine('tabula')
+    pdfplumber_engine = get_table_extraction_engine('pdfplumber')
+
+    _, jvm_seconds = timed(tabula_engine.start)
+    print(f"tabula JVM startup: {jvm_seconds:.2f}s (paid once per process, not included below)\n")
+
+    totals = {'tabula': 0.0, 'pdfplumber': 0.0, 'pdfplumber (page already parsed)': 0.0}
+    failures = []
+    for pdf_path in pdf_paths:
+        print(pdf_path)
+        with BulletinPdf(pdf_path) as pdf:
+            table_pages = locate_wholesale_table_pages(pdf)
+        for page in (1, 2):
+            # fresh documents so neither engine benefits from pages parsed by the other
+            with BulletinPdf(pdf_path) as pdf:
+                if page > pdf.page_count:
+                    continue
+                tabula_df, tabula_seconds = timed(tabula_engine.extract, pdf, page)
+            with BulletinPdf(pdf_path) as pdf:
+                pdfplumber_df, pdfplumber_seconds = timed(pdfplumber_engine.extract, pdf, page)
+            # when the page has already been parsed (eg: its text was extracted) pdfplumber reuses it
+            with BulletinPdf(pdf_path) as pdf:
+                pdf.page_text(page)
+                _, pdfplumber_parsed_seconds = timed(pdfplumber_engine.extract, pdf, page)
+            totals['tabula'] += tabula_seconds
+            totals['pdfplumber'] += pdfplumber_seconds
+            totals['pdfplumber (page already parsed)'] += pdfplumber_parsed_seconds
+
+            if isinstance(tabula_df, Exception) or isinstance(pdfplumber_df, Exception):
+                ok, parity = False, f"error: tabula {tabula_df!r:.60}, pdfplumber {pdfplumber_df!r:.60}"
+            else:
+                ok, parity = compare_tables(tabula_df, pdfplumber_df)
+            if page not in table_pages:
+                parity += ' (not a wholesale table page)'
+            elif not ok:
+                failures.append(f"{pdf_path} page {page}: {parity}")
+            print(f"  page {page}: tabula {tabula_seconds:.2f}s, pdfplumber {pdfplumber_seconds:.2f}s "
+                  f"({pdfplumber_parsed_seconds:.2f}s on a parsed page) - {parity}")
+
+        with open(pdf_path, 'rb') as f:
+            pdf_content = f.read()
+        outputs = {}
+        for engine in (tabula_engine, pdfplumber_engine):
+            extractor.table_extraction_engine = engine
+            output, _ = timed(extract_and_transform_pdf, pdf_content, pdf_path)
+            outputs[engine.name] = output
+        ok, parity = compare_outputs(outputs['tabula'], outputs['pdfplumber'])
+        if not ok:
+            failures.append(f"{pdf_path} transformed output: {parity}")
+        print(f"  transformed output: {parity}")
+
+    print('\ntotal page extraction time: ' + ', '.join(f"{name} {seconds:.2f}s" for name, seconds in totals.items()))
+    for failure in failures:
+        print(f"FAILED {failure}")
+    return failures
+
+if __name__ == '__main__':
+    if main(sys.argv[1:] or sorted(glob.glob('data/*.pdf'))):
+        sys.exit(1)
@@ -1,238 +1,217 @@
 # main.py
-import logging.handlers
-import os
+# Only light modules are imported at the top. The pdf processing and ingestion modules (pandas, pdfplumber, tabula,
+# the cosmos sdk) are imported once the listing has new bulletins, so a run without new PDFs (most runs) does not pay
+# for them on a cold start. Track the startup cost with: python -m benchmarks.startup_benchmark
+import time
+IMPORT_STARTED = time.perf_counter()
 import asyncio
 import platform
-import itertools
 import warnings
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import logging # for use in Azure functions environment (replace all calls to logger object with python logging class)
-from src import logHandling
-from src.logHandling import log_messages
-import pdfminer.pdfparser
-# from src.localLogging import logger
-import pdfminer
-from src.utils.log_utils import send_log
-from src.connector.cosmos_db import write_harti_data_to_cosmosdb
-from src.configuration.configuration import pdf_source_url, metadata_line1
-from src.pipeline2.meta_data_checker import find_line_with_metadata
-from src.pipeline2.get_pdfdata import (
-    get_latest_pdf_link,
-    download_pdf_as_bytes,
-    extract_text_from_page1,
-    extract_text_from_page2
-)
-from src.pipeline2.extract_table_from_pdf_to_df import (
-    extract_tables_from_pdf_to_df_page_1,
-    extract_tables_from_pdf_to_df_page_2
-)
-from src.pipeline2.cleaning_column_values import clean_dataframe
-from src.pipeline2.data_transformation import (
-    rename_columns_before_dot,
-    transform_food_df,
-    rename_first_column,
-    update_item_names,
-    split_and_convert_value_column,
-    insert_database_write_date,
-    drop_rows_with_missing_values_in_value_column,preprocess_dataframe,convert_dates,add_page_number_column
-)
-from src.pipeline2.data_format_converter import (
-    dataframe_to_csv_string,convert_dataframe_to_cosmos_format)
-
-from src.connector.blob import upload_to_blob, upload_processed_pdfs, download_processed_pdfs, update_logs
-
-warnings.filterwarnings('ignore')
-
-from azure.storage.blob import BlobServiceClient
 from dotenv import load_dotenv, find_dotenv
-load_dotenv(find_dotenv()) # read local .env file
-from src.configuration.configuration import WEB_SOURCE
-
-container_name = os.getenv('container_name_blob')
-az_blob_conn_str = os.getenv('connect_str')
+load_dotenv(find_dotenv()) # read local .env file, before the configuration is read
+from src.logHandling import start_worker_log_listener
+# from src.localLogging import logger
+# from src.utils.log_utils import send_log
+from src.configuration.configuration import pdf_source_url, MAX_CONCURRENT_PDFS
+from src.utils.metrics import PdfMetrics, RunMetrics
 
 
 
-def load_processed_pdfs(status_file_string: str):
-    """Expects a string consisting of pdf_link lines, returns it as a set
+async def process_pdf(pdf_link, process_pool, semaphore, http_client, cosmos_connection, pdf_cache=None, metrics=None):
+    """Downloads a pdf, extracts & transforms its wholesale price table in the process pool and ingests it to cosmos db.
+    Returns the transformed DataFrame (None on failure) so that the caller can commit results in Harti website order.
     """
-    mySet = set()
-    status_file_lines = status_file_string.rsplit('\n')
-    for line in status_file_lines:
-        mySet.add(line.strip())
-    return mySet
-
-def load_procssed_pdfs_as_list(status_file_string: str) -> list[str]:
-    """Expects a string consisting of pdf_link lines, returns it as a reversed list (so firt index is typically the oldest link from the Harti website)
-    """
-    list = []
-    status_file_lines = status_file_string.rsplit('\n')
-    for line in status_file_lines:
-        list.append(line.strip())
-    list.reverse()
-    return list
-
-def get_all_pdf_links(pdf_source):
-    response = requests.get(pdf_source)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    pdf_links = soup.find_all('a', href=True)
-    
-    all_pdf_links: list[str] = []
-    for link in pdf_links:
-        if '.pdf' in link['href']:
-            full_link = urljoin(pdf_source, link['href'])
-            all_pdf_links.append(full_link.strip())
-    
-    return all_pdf_links
+    from pdfminer.pdfparser import PDFSyntaxError
+    from src.connector.cosmos_db import write_harti_data_to_cosmosdb
+    from src.pipeline2.get_pdfdata import download_pdf
+    from src.pipeline2.pdf_processing import extract_and_transform_pdf_with_metrics
+    from src.pipeline2.data_format_converter import convert_dataframe_to_cosmos_format
+
+    async with semaphore:
+        try:
+            logging.info(f">>>> Starting the data extraction process for {pdf_link} <<<<")
+
+            # Download the latest PDF
+            # latest_pdf_link = await get_latest_pdf_link(pdf_source_url, http_client)
+
+            metrics = metrics or PdfMetrics(pdf_link)
+            with metrics.stage('download') as record:
+                pdf = await download_pdf(pdf_link, http_client, pdf_cache)
+                record['bytes'] = pdf.size if pdf is not None else 0
+            if pdf is None:
+                logging.error(f"Could not download PDF {pdf_link}")
+                return None
+
+            # Text extraction, table extraction and data transformation are CPU bound, so they run in the process pool
+            loop = asyncio.get_running_loop()
+            # a pdf spooled to disk is sent to the worker as its file path, not as a copy of its content
+            with pdf, metrics.stage('extract_and_transform') as record:
+                food_df, worker_metrics = await loop.run_in_executor(process_pool, extract_and_transform_pdf_with_metrics, pdf.source(), pdf_link)
+                record['rows'] = len(food_df) if food_df is not None else 0
+            # the stages recorded inside the worker process
+            metrics.merge(worker_metrics)
+            if food_df is None:
+                return None
+
+            # Save the Data to cosmos db
+            logging.info(">>>> Saving the Data to cosmos db format <<<<")
+            with metrics.stage('cosmos_write', rows=len(food_df)):
+                cosmos_data = convert_dataframe_to_cosmos_format(food_df)
+                await write_harti_data_to_cosmosdb(cosmos_data, cosmos_connection)
+            logging.info(">>>> Data Ingested to CosmosDB <<<<")
+
+            # # Send success log
+            # send_log(
+            #     service_type="Azure Functions",
+            #     application_name="Harti Food Price Collector Page 2",
+            #     project_name="Harti Food Price Prediction",
+            #     project_sub_name="Food Price History",
+            #     azure_hosting_name="AI Services",
+            #     developmental_language="Python",
+            #     description="Sri Lanka Food Prices - Azure Functions",
+            #     created_by="BrownsAIsevice",
+            #     log_print="Successfully completed data ingestion to Cosmos DB.",
+            #     running_within_minutes=1440,
+            #     error_id=0
+            #     )
+            # logging.info("Sent success log to function monitoring service.")
+
+            # logging.info(f">>>> {pdf_link} <<<<")
+
+            return food_df
+
+        except PDFSyntaxError:
+            logging.error(f"PDF Syntax Error{pdf_link}")
+        except Exception as e:
+            logging.error(f"Error processing PDF {pdf_link}: {e}")
+
+            # # Send error log
+            # send_log(
+            #     service_type="Azure Functions",
+            #     application_name="Harti Food Price Collector Page 2",
+            #     project_name="Harti Food Price Prediction",
+            #     project_sub_name="Food Price History",
+            #     azure_hosting_name="AI Services",
+            #     developmental_language="Python",
+            #     description="Sri Lanka Food Prices - Azure Functions",
+            #     created_by="BrownsAIsevice",
+            #     log_print="An error occurred: " + str(e),
+            #     running_within_minutes=1440,
+            #     error_id=1,
+            #     )
+        
+            # logging.error("Sent error log to function monitoring service.")
 
-async def process_pdf(pdf_link):
-    try:
-        logging.info(">>>> Starting the data extraction process <<<<")
+            # # raise
 
-        # Download the latest PDF
-        # latest_pdf_link = get_latest_pdf_link(pdf_source_url)
+        return None
 
-        pdf_bytes = download_pdf_as_bytes(pdf_link)
-        
-        # Extract text from both pages
-        extracted_text_1 = extract_text_from_page1(pdf_bytes)
-        extracted_text_2 = extract_text_from_page2(pdf_bytes)
-        
-        # Split text into lines
-        extracted_lines_1 = [text.split('\n') for text in extracted_text_1]
-        extracted_lines_2 = [text.split('\n') for text in extracted_text_2]
-
-        # Flatten the list of lists into a single list of lines
-        flattened_extracted_lines_1 = list(itertools.chain.from_iterable(extracted_lines_1))
-        flattened_extracted_lines_2 = list(itertools.chain.from_iterable(extracted_lines_2))
-
-        # Check metadata in Page 1
-        if find_line_with_metadata(flattened_extracted_lines_1, metadata_line1):
-            
-            logging.info(">>>> Metadata line found on Page 1, proceeding with data extraction from Page 1... <<<<")
-            food_df = extract_tables_from_pdf_to_df_page_1(pdf_bytes)
-        
-        # Check metadata in Page 2 if not found in Page 1
-        elif find_line_with_metadata(flattened_extracted_lines_2, metadata_line1):
+def upload_food_df_to_blob(food_df):
+    from src.connector.blob import upload_to_blob, upload_parquet
+    from src.pipeline2.data_format_converter import dataframe_to_csv_string
 
-            logging.info(">>>> Metadata line is not found on Page 2, proceeding with data extraction from Page 2... <<<<")
-            food_df = extract_tables_from_pdf_to_df_page_2(pdf_bytes)
-        
-        else:
-            logging.error(">>>> Metadata line not found on either page. Aborting data extraction. <<<<")
-            return
-        
-        # Data transformation
-        logging.info(">>>> Staring data transformation <<<<")
-
-        food_df = clean_dataframe(food_df)
-        food_df = rename_columns_before_dot(food_df)
-        food_df = rename_first_column(food_df)
-        food_df = preprocess_dataframe(food_df)
-        food_df = convert_dates(food_df)
-        food_df = transform_food_df(food_df)
-        food_df = update_item_names(food_df)
-        food_df = split_and_convert_value_column(food_df)
-        food_df = insert_database_write_date(food_df)
-        food_df = drop_rows_with_missing_values_in_value_column(food_df)
-        food_df = add_page_number_column(food_df)
-        # food_df.to_csv('food.csv', index=False)
-        logging.info(">>>> Data transformation finished <<<<")
-
-        # Save the DataFrame to a CSV in blob storage
-        csv_data,actual_date_str = dataframe_to_csv_string(food_df)
-        upload_to_blob(csv_data,actual_date_str)
-        logging.info(">>>> Uploaded CSV to blob storage <<<<")
-
-        # Save the Data to cosmos db
-        logging.info(">>>> Saving the Data to cosmos db format <<<<")
-        cosmos_data = convert_dataframe_to_cosmos_format(food_df)
-        await write_harti_data_to_cosmosdb(cosmos_data)
-        logging.info(">>>> Data Ingested to CosmosDB <<<<")
-
-        # # Send success log
-        # send_log(
-        #     service_type="Azure Functions",
-        #     application_name="Harti Food Price Collector Page 2",
-        #     project_name="Harti Food Price Prediction",
-        #     project_sub_name="Food Price History",
-        #     azure_hosting_name="AI Services",
-        #     developmental_language="Python",
-        #     description="Sri Lanka Food Prices - Azure Functions",
-        #     created_by="BrownsAIsevice",
-        #     log_print="Successfully completed data ingestion to Cosmos DB.",
-        #     running_within_minutes=1440,
-        #     error_id=0
-        #     )
-        # logging.info("Sent success log to function monitoring service.")
-
-        # logging.info(f">>>> {pdf_link} <<<<")
-
-    except Exception as e:
-        logging.error(f"Error processing PDF {pdf_link}: {e}")
-
-        # # Send error log
-        # send_log(
-        #     service_type="Azure Functions",
-        #     application_name="Harti Food Price Collector Page 2",
-        #     project_name="Harti Food Price Prediction",
-        #     project_sub_name="Food Price History",
-        #     azure_hosting_name="AI Services",
-        #     developmental_language="Python",
-        #     description="Sri Lanka Food Prices - Azure Functions",
-        #     created_by="BrownsAIsevice",
-        #     log_print="An error occurred: " + str(e),
-        #     running_within_minutes=1440,
-        #     error_id=1,
-        #     )
-        
-        # logging.error("Sent error log to function monitoring service.")
+    # Save the DataFrame to a CSV in blob storage
+    csv_data,actual_date_str = dataframe_to_csv_string(food_df)
+    upload_to_blob(csv_data,actual_date_str)
+    logging.info(">>>> Uploaded CSV to blob storage <<<<")
+    upload_parquet(food_df)
 
-        # # raise     
+async def main(run_metrics=None):
+    from src.connector.http_client import HttpClient
+    from src.connector.blob import download_listing_state, upload_listing_state
+    from src.pipeline2.link_discovery import LinkDiscovery
 
-async def main():
+    # one pooled http session (keep-alive connections) for link discovery and all pdf downloads of the run
+    http_client = HttpClient()
+    pdf_cache = None
+    cosmos_connection = None
+    processed_pdfs = None
+    run_metrics = run_metrics or RunMetrics()
     try:
 
-        # Get all links from Harti website
-        pdf_links = get_all_pdf_links(pdf_source_url)
-        if not pdf_links:
+        # Check the Harti website listing, a listing unchanged since the last run ends the run before the tracker is loaded
+        link_discovery = LinkDiscovery(pdf_source_url, http_client, await asyncio.to_thread(download_listing_state))
+        if not await link_discovery.listing_changed():
+            if link_discovery.listing_state_outdated():
+                # no new bulletin, the new ETag / Last-Modified / hash are saved for the conditional request of the next run
+                await asyncio.to_thread(upload_listing_state, link_discovery.listing_state())
+            logging.info(">>>> No new PDFs on the Harti website <<<<")
+            return
+        if not link_discovery.first_page_links:
             logging.warning("No PDF links found.")
             return
 
-        # Load already processed PDFs
-        status_file_string = download_processed_pdfs()
-        processed_pdfs = load_processed_pdfs(status_file_string) # set
-        processed_pdfs_list = load_procssed_pdfs_as_list(status_file_string) # list
-
-        # Loop through each PDF link and process it
-        for pdf_link in reversed(pdf_links): # loop thru list of pdf links, starting from oldest first
-            if pdf_link not in processed_pdfs: # this operation is fast cuz processed_pdfs is a set
-                logging.info(f"New PDF link: {pdf_link}")
-                try:
-                    await process_pdf(pdf_link)   
-                except pdfminer.pdfparser.PDFSyntaxError:
-                    logging.error(f"PDF Syntax Error{pdf_link}")
-                processed_pdfs_list.append(pdf_link)  
-            else:
-                logging.info(f"Skipping already processed PDF link: {pdf_link}")
-
+        # there are new bulletins, only now the processing / ingestion modules are needed
+        from src.connector.cosmos_db import CosmosConnection
+        from src.connector.pdf_cache import get_pdf_cache
+        from src.connector.processed_pdf_tracker import ProcessedPdfTracker
+        from src.pipeline2.pdf_processing import init_worker
+
+        pdf_cache = get_pdf_cache()
+        # one cosmos client for the run, the database / container are only checked when the first pdf is ingested
+        cosmos_connection = CosmosConnection()
+
+        # Load already processed PDFs (tracker file + journal of the links checkpointed since it was last compacted)
+        processed_pdfs = await asyncio.to_thread(ProcessedPdfTracker().load)
+
+        # New links are found newest first, process them starting from oldest first
+        new_pdf_links = list(reversed(await link_discovery.new_pdf_links(processed_pdfs)))
+        for pdf_link in new_pdf_links:
+            logging.info(f"New PDF link: {pdf_link}")
+
+        # Process the new PDFs concurrently (bounded by MAX_CONCURRENT_PDFS), but commit the results
+        # (monthly csv + processed pdf tracker) strictly in the order of the links, oldest first
+        log_queue = multiprocessing.Queue()
+        log_listener = start_worker_log_listener(log_queue)
+        try:
+            with ProcessPoolExecutor(max_workers=MAX_CONCURRENT_PDFS, initializer=init_worker, initargs=(log_queue,)) as process_pool:
+                semaphore = asyncio.Semaphore(MAX_CONCURRENT_PDFS)
+                pdf_metrics = [PdfMetrics(pdf_link) for pdf_link in new_pdf_links]
+                tasks = [asyncio.create_task(process_pdf(pdf_link, process_pool, semaphore, http_client, cosmos_connection, pdf_cache, metrics))
+                         for pdf_link, metrics in zip(new_pdf_links, pdf_metrics)]
+                for pdf_link, metrics, task in zip(new_pdf_links, pdf_metrics, tasks):
+                    food_df = await task
+                    if food_df is not None:
+                        try:
+                            with metrics.stage('blob_upload', rows=len(food_df)):
+                                await asyncio.to_thread(upload_food_df_to_blob, food_df)
+                        except Exception as e:
+                            logging.error(f"Error uploading CSV of PDF {pdf_link}: {e}")
+                    # checkpoint right away, so a crash / timeout later in the run does not redo this pdf
+                    with metrics.stage('tracker_checkpoint'):
+                        await asyncio.to_thread(processed_pdfs.add, pdf_link)
+                    run_metrics.add(metrics)
+        finally:
+            log_listener.stop()
+
+        # the listing state is only saved once every new link is checkpointed, so a crash never hides a bulletin
+        await asyncio.to_thread(processed_pdfs.checkpoint)
+        await asyncio.to_thread(upload_listing_state, link_discovery.listing_state())
+
+        run_metrics.log_summary()
         logging.info(">>>> Data extraction process completed <<<<")
 
-        # update processed pdf tracker file in blob (which has now processed all pdf links)
-        processed_pdfs_string = ''
-        for link in reversed(processed_pdfs_list): # using the list here is computationally efficient, and makes the processed pdf tracker sorted in the Harti website order, making it easier for the user to review and manipulate
-            processed_pdfs_string += link
-            processed_pdfs_string += '\n'
-        upload_processed_pdfs(processed_pdfs_string)
-        logging.info(">>>> Processed PDF Tracker uploaded to blob <<<<")
-
     except Exception as e:
         logging.error(f"Error in main execution: {e}")
         raise
+    finally:
+        if processed_pdfs is not None:
+            # checkpoint the links processed since the last checkpoint (only pending when tracker_checkpoint_every > 1)
+            processed_pdfs.close()
+            logging.info(">>>> Processed PDF Tracker checkpointed to blob <<<<")
+        await http_client.close()
+        if cosmos_connection is not None:
+            await cosmos_connection.close()
+        if pdf_cache is not None:
+            pdf_cache.close()
     
 def run_main():
+    warnings.filterwarnings('ignore')
+    from src.connector.blob import upload_run_metrics
+    from src.connector.log_shipping import start_log_shipping
 
     if platform.system() == "Windows":
         asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
@@ -245,9 +224,22 @@ def run_main():
         asyncio.set_event_loop(loop)
 
     # loop = asyncio.get_event_loop()
-    loop.run_until_complete(main())
-    try: update_logs(log_messages)
-    except Exception as e: logging.ERROR(f'Exception when updating logs: {e}')
+    # the logs are streamed to the run's log blob while the run is going on
+    log_shipper = start_log_shipping()
+    run_metrics = RunMetrics()
+    # cold start cost: importing main and the modules of the entry point, cpu time includes the interpreter start up
+    run_metrics.startup = {
+        'import_seconds': time.perf_counter() - IMPORT_STARTED,
+        'cpu_seconds': time.process_time(),
+    }
+    try:
+        loop.run_until_complete(main(run_metrics))
+    finally:
+        try: upload_run_metrics(run_metrics.to_document())
+        except Exception as e: logging.error(f'Exception when uploading run metrics: {e}')
+        if log_shipper is not None:
+            log_shipper.close()
 
 
-run_main()
+if __name__ == "__main__":
+    run_main()
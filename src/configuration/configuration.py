@@ -1,12 +1,68 @@
 # src/configuration/configuration.py
 
 import os
+import tempfile
 
 STATUS_FILE = 'processed_pdfs.txt'
+STATUS_JOURNAL_FILE = 'processed_pdfs_journal.txt'
+LISTING_STATE_FILE = 'listing_state.json'
 WEB_SOURCE = 'https://www.harti.gov.lk/index.php/en/market-information/data-food-commodities-bulletin'
 LOG_FILE_NAME = 'log'
 LOG_FILE_EXTENSION = 'txt'
 NUMBER_OF_LOG_FILES_TO_KEEP = 10
+# Log shipping: at most this many log messages are buffered in memory, the buffer is appended to the run's log blob every N seconds
+LOG_BUFFER_MAX_RECORDS = int(os.getenv('log_buffer_max_records', '10000'))
+LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv('log_flush_interval_seconds', '30'))
+METRICS_FILE_NAME = 'metrics'
+METRICS_FILE_EXTENSION = 'json'
+
+# Number of PDFs processed concurrently (downloads/uploads overlap on the event loop, extraction runs in a process pool of this size)
+MAX_CONCURRENT_PDFS = int(os.getenv('max_concurrent_pdfs', '4'))
+
+# Shared HTTP client (link discovery and pdf downloads)
+HTTP_MAX_CONNECTIONS = int(os.getenv('http_max_connections', '20'))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv('http_max_connections_per_host', '4'))
+HTTP_TIMEOUT_SECONDS = float(os.getenv('http_timeout_seconds', '60'))
+HTTP_RETRY_ATTEMPTS = int(os.getenv('http_retry_attempts', '3'))
+
+# Local cache of downloaded pdfs (set pdf_cache_dir to an empty value to disable it)
+PDF_CACHE_DIR = os.getenv('pdf_cache_dir', os.path.join(tempfile.gettempdir(), 'harti_pdf_cache'))
+PDF_CACHE_MAX_BYTES = int(os.getenv('pdf_cache_max_mb', '1024')) * 1024 * 1024
+
+# Downloaded pdfs are streamed into memory up to pdf_spool_max_memory_mb and into a temporary file in pdf_spool_dir beyond that,
+# pdfs larger than pdf_max_mb are refused
+PDF_SPOOL_MAX_MEMORY_BYTES = int(float(os.getenv('pdf_spool_max_memory_mb', '1')) * 1024 * 1024)
+PDF_SPOOL_DIR = os.getenv('pdf_spool_dir', tempfile.gettempdir())
+PDF_MAX_BYTES = int(float(os.getenv('pdf_max_mb', '50')) * 1024 * 1024)
+
+# Cosmos DB bulk writes: concurrent transactional batches (at most 100 upserts each)
+COSMOS_MAX_CONCURRENCY = int(os.getenv('cosmos_max_concurrency', '8'))
+COSMOS_BATCH_SIZE = int(os.getenv('cosmos_batch_size', '100'))
+# Cosmos document ids: 'key' (derived from Date, Location, Item_Names, Page, so re-ingesting a bulletin overwrites its documents),
+# 'content' (derived from the key and the prices) or 'random' (uuid4, every ingestion inserts new documents)
+COSMOS_DOCUMENT_ID_MODE = os.getenv('cosmos_document_id_mode', 'key')
+
+# Table extraction engine: 'tabula' (tabula-java lattice mode, needs Java) or 'pdfplumber' (pure python lattice)
+TABLE_EXTRACTION_ENGINE = os.getenv('table_extraction_engine', 'tabula')
+
+# Monthly CSV upload: 'append' (only the new rows are sent, see src/connector/csv_store.py) or 'rewrite' (download and re-upload the whole month)
+CSV_UPLOAD_MODE = os.getenv('csv_upload_mode', 'append')
+# Monthly CSV storage for the append mode: 'azure' (blob storage or Azurite) or 'local' (files in csv_store_local_dir)
+CSV_STORE_BACKEND = os.getenv('csv_store_backend', 'azure')
+CSV_STORE_LOCAL_DIR = os.getenv('csv_store_local_dir', 'csv_store')
+# Partitioned parquet copy of the prices next to the monthly CSV files (see src/connector/parquet_store.py):
+# '' (off), 'azure' (blob storage under parquet_store_blob_prefix) or 'local' (files in parquet_store_local_dir)
+PARQUET_STORE_BACKEND = os.getenv('parquet_store_backend', '')
+PARQUET_STORE_LOCAL_DIR = os.getenv('parquet_store_local_dir', 'parquet_store')
+PARQUET_STORE_BLOB_PREFIX = os.getenv('parquet_store_blob_prefix', 'parquet')
+
+# Offline backfill (backfill.py): output directories of the local sinks and the local emulators
+BACKFILL_CSV_DIR = os.getenv('backfill_csv_dir', os.path.join('backfill_output', 'csv'))
+BACKFILL_PARQUET_DIR = os.getenv('backfill_parquet_dir', os.path.join('backfill_output', 'parquet'))
+# Azurite and the Cosmos DB emulator (their well known development credentials by default)
+EMULATOR_BLOB_CONNECTION_STRING = os.getenv('emulator_blob_connection_string', 'UseDevelopmentStorage=true')
+EMULATOR_COSMOS_ENDPOINT = os.getenv('emulator_cosmos_endpoint', 'https://localhost:8081/')
+EMULATOR_COSMOS_KEY = os.getenv('emulator_cosmos_key', 'C2y6yDjf5/R+ob0N8A7Cgv30VRDJIWEHLM+4QDU5DE2nQ9nDuVTqobD4b8mGGyPMbIZnqyMsEcaGQy67XIw/Jw==')
 
 # Date column
 date_col = 'Date'
@@ -28,6 +84,17 @@ pdf_source_url = 'https://www.harti.gov.lk/index.php/en/market-information/data-
 
 # # MetaData line to search
 metadata_line1 = '(Wholesale Prices of Rice & Subsidiary Food Crops)'
+# First header cell of the wholesale price table, marks the page that holds it
+wholesale_table_marker = 'Variety'
 
+# Link discovery: 'incremental' (walks the listing pages newest first and stops at the first processed link, skips the run
+# when the listing is unchanged since the last run) or 'full' (every link of every listing page is checked against the tracker)
+LINK_DISCOVERY_MODE = os.getenv('link_discovery_mode', 'incremental')
+LINK_DISCOVERY_MAX_PAGES = int(os.getenv('link_discovery_max_pages', '50'))
 
+# Processed pdf tracker: links are appended to the journal every N processed pdfs, and the journal is folded into the tracker file once it holds this many links
+TRACKER_CHECKPOINT_EVERY = int(os.getenv('tracker_checkpoint_every', '1'))
+TRACKER_COMPACT_EVERY = int(os.getenv('tracker_compact_every', '50'))
 
+# Profiling of a run (comma separated, empty = off): 'cprofile' (top functions of every pdf in the run metrics) and / or 'tracemalloc' (exact peak memory per stage)
+PROFILE_MODE = os.getenv('profile_mode', '')
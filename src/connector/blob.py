@@ -1,27 +1,55 @@
 # connector & and upload_to_blob.py
 from azure.storage.blob import BlobServiceClient
 # from src.configuration.configuration import connect_str, container_name_blob
-import pandas as pd
-from io import StringIO
 from dotenv import load_dotenv
 import os
-from src.configuration.configuration import STATUS_FILE, LOG_FILE_NAME, LOG_FILE_EXTENSION, NUMBER_OF_LOG_FILES_TO_KEEP
+from src.configuration.configuration import STATUS_FILE, STATUS_JOURNAL_FILE, LISTING_STATE_FILE, METRICS_FILE_NAME, METRICS_FILE_EXTENSION, NUMBER_OF_LOG_FILES_TO_KEEP, CSV_UPLOAD_MODE, PARQUET_STORE_BACKEND
+from src.connector.csv_store import get_csv_store, monthly_csv_file_name
 from datetime import datetime
 from azure.core.exceptions import ResourceNotFoundError
 import re
+from concurrent.futures import ThreadPoolExecutor
+import json
 
 load_dotenv()
 
 connect_str = os.getenv('connect_str')
 container_name_blob = os.getenv('container_name_blob')
 
+csv_store = None
+parquet_store = None
+
 def upload_to_blob(csv_data, actual_date_str):
-    date_object = datetime.strptime(actual_date_str, '%Y-%m-%d')
-    year = date_object.year
-    month = date_object.month
+    if CSV_UPLOAD_MODE == 'append':
+        append_to_blob(csv_data, actual_date_str)
+    else:
+        rewrite_blob(csv_data, actual_date_str)
 
+def append_to_blob(csv_data, actual_date_str):
+    """Appends only the rows of the new bulletin to its monthly CSV file (see src/connector/csv_store.py)
+    """
+    global csv_store
+    if csv_store is None:
+        csv_store = get_csv_store()
+    file_name = csv_store.append(csv_data, actual_date_str)
+    print(f"Appended {file_name} in {csv_store.name} csv store")
+
+def upload_parquet(food_df):
+    """Writes the bulletin into the partitioned parquet dataset, if enabled with parquet_store_backend (see src/connector/parquet_store.py)
+    """
+    global parquet_store
+    if not PARQUET_STORE_BACKEND:
+        return
+    if parquet_store is None:
+        # pyarrow is only imported when the parquet output is enabled
+        from src.connector.parquet_store import get_parquet_store
+        parquet_store = get_parquet_store()
+    paths = parquet_store.append(food_df)
+    print(f"Wrote {len(paths)} parquet files in {parquet_store.name} parquet store")
+
+def rewrite_blob(csv_data, actual_date_str):
     # We want all the csv_data corresponding to a month to be on one file in the name format year-month.csv. eg: 2024-10.csv
-    file_name = str(year) + '-' + str(month) + 'page2.csv'
+    file_name = monthly_csv_file_name(actual_date_str)
     print(f"File name to upload: {file_name}")
 
     blob_service_client = BlobServiceClient.from_connection_string(connect_str)
@@ -60,42 +88,88 @@ def upload_processed_pdfs(file_as_string):
     """
     blob_service_client = BlobServiceClient.from_connection_string(connect_str)
     container_client = blob_service_client.get_container_client(container= container_name_blob) 
-    blob_client = container_client.upload_blob(name=STATUS_FILE, data=file_as_string, overwrite=True)
-
-def update_logs(log_messages: list[str]):
-    # each run will generate a log file. We will only store the most recent 10 log files in the blob.
+    container_client.upload_blob(name=STATUS_FILE, data=file_as_string, overwrite=True)
 
+def download_processed_pdfs_journal():
+    """Downloads the processed pdf link journal (links appended since the tracker was last compacted), '' if there is none
+    """
     blob_service_client = BlobServiceClient.from_connection_string(connect_str)
     container_client = blob_service_client.get_container_client(container= container_name_blob)
+    try:
+        return container_client.download_blob(STATUS_JOURNAL_FILE, encoding='UTF-8').readall()
+    except ResourceNotFoundError:
+        return ''
+
+def append_processed_pdfs_journal(file_as_string):
+    """Appends given string to the processed pdf link journal (an append blob, so every append is atomic and only sends the new links)
+    """
+    blob_service_client = BlobServiceClient.from_connection_string(connect_str)
+    blob_client = blob_service_client.get_blob_client(container=container_name_blob, blob=STATUS_JOURNAL_FILE)
+    try:
+        blob_client.append_block(file_as_string.encode('utf-8'))
+    except ResourceNotFoundError:
+        blob_client.create_append_blob()
+        blob_client.append_block(file_as_string.encode('utf-8'))
+
+def delete_processed_pdfs_journal():
+    """Deletes the processed pdf link journal, after it has been folded into the tracker
+    """
+    blob_service_client = BlobServiceClient.from_connection_string(connect_str)
+    blob_client = blob_service_client.get_blob_client(container=container_name_blob, blob=STATUS_JOURNAL_FILE)
+    try:
+        blob_client.delete_blob()
+    except ResourceNotFoundError:
+        pass
 
-    # get existing log file names
-    blob_list = container_client.list_blobs()
-    log_blobs = []
-    # pattern = r'^log\d+\.txt$'
-    pattern = f'^{LOG_FILE_NAME}\d+\.{LOG_FILE_EXTENSION}$'
-    for blob in blob_list:
-        if bool(re.match(pattern, blob.name)):
-            log_blobs.append(blob.name)
+def download_listing_state():
+    """Downloads the state of the bulletin listing at the end of the last run (see src/pipeline2/link_discovery.py), {} if there is none
+    """
+    blob_service_client = BlobServiceClient.from_connection_string(connect_str)
+    container_client = blob_service_client.get_container_client(container= container_name_blob)
+    try:
+        return json.loads(container_client.download_blob(LISTING_STATE_FILE, encoding='UTF-8').readall())
+    except (ResourceNotFoundError, ValueError):
+        return {}
 
+def upload_listing_state(listing_state: dict):
+    blob_service_client = BlobServiceClient.from_connection_string(connect_str)
+    container_client = blob_service_client.get_container_client(container= container_name_blob)
+    container_client.upload_blob(name=LISTING_STATE_FILE, data=json.dumps(listing_state), overwrite=True)
 
-    # sort log file names in descending order (so youngest log file is at index 0)
-    log_blobs.sort(reverse=True)
+def delete_old_run_files(container_client, file_name, file_extension, keep=NUMBER_OF_LOG_FILES_TO_KEEP - 1):
+    # only list the blobs starting with the file name (eg: log<timestamp>.txt), not the whole container
+    pattern = f'^{file_name}\d+\.{file_extension}$'
+    run_blobs = [blob for blob in container_client.list_blobs(name_starts_with=file_name) if re.match(pattern, blob.name)]
 
-    # only keep the youngest specified number of log files, delete the rest
-    log_blobs_to_delete = log_blobs[NUMBER_OF_LOG_FILES_TO_KEEP - 1:]
-    for log_blob_to_delete in log_blobs_to_delete:
-        blob_client = container_client.get_blob_client(log_blob_to_delete)
-        blob_client.delete_blob()
+    # youngest file first (the timestamps in the names are not zero padded, so they do not sort)
+    run_blobs.sort(key=lambda blob: blob.last_modified, reverse=True)
 
-    log_file_string = ''
+    # only keep the youngest specified number of files, delete the rest concurrently
+    run_blobs_to_delete = [blob.name for blob in run_blobs[keep:]]
+    if run_blobs_to_delete:
+        with ThreadPoolExecutor(max_workers=min(len(run_blobs_to_delete), 8)) as executor:
+            list(executor.map(lambda name: delete_blob_if_exists(container_client, name), run_blobs_to_delete))
 
-    # add new logs to the string
-    for log_message in log_messages: log_file_string += (log_message + '\n')
+def delete_blob_if_exists(container_client, blob_name):
+    try:
+        container_client.delete_blob(blob_name)
+    except ResourceNotFoundError: # deleted by a concurrent run
+        pass
 
-    # upload the new log file
+def new_run_file_name(file_name, file_extension):
     current_datetime = datetime.now()
-    new_log_file_name = LOG_FILE_NAME + str(current_datetime.year) + str(current_datetime.month) + str(current_datetime.day) + str(current_datetime.hour) + str(current_datetime.minute) + str(current_datetime.second) + '.' + LOG_FILE_EXTENSION
-    blob_client = container_client.upload_blob(name=new_log_file_name, data=log_file_string, overwrite=True)
+    return file_name + str(current_datetime.year) + str(current_datetime.month) + str(current_datetime.day) + str(current_datetime.hour) + str(current_datetime.minute) + str(current_datetime.second) + '.' + file_extension
+
+def upload_run_metrics(metrics_document: dict):
+    """Uploads the metrics document of the run (see src/utils/metrics.py) next to its log file, keeping the same number of files
+    """
+    blob_service_client = BlobServiceClient.from_connection_string(connect_str)
+    container_client = blob_service_client.get_container_client(container= container_name_blob)
+
+    delete_old_run_files(container_client, METRICS_FILE_NAME, METRICS_FILE_EXTENSION)
+
+    new_metrics_file_name = new_run_file_name(METRICS_FILE_NAME, METRICS_FILE_EXTENSION)
+    container_client.upload_blob(name=new_metrics_file_name, data=json.dumps(metrics_document, indent=2, default=str), overwrite=True)
 
 
 
@@ -1,7 +1,12 @@
 from azure.cosmos.aio import CosmosClient
 from azure.cosmos import exceptions, PartitionKey
+from azure.cosmos.partition_key import NonePartitionKeyValue
 # from src.configuration.configuration import endpoint, key, database_name, container_name_cosmos
+from src.configuration.configuration import COSMOS_MAX_CONCURRENCY, COSMOS_BATCH_SIZE
 from dotenv import load_dotenv
+import asyncio
+import logging
+import time
 import os
 
 load_dotenv()
@@ -11,9 +16,6 @@ key = os.getenv('key')
 database_name = os.getenv('database_name')
 container_name_cosmos = os.getenv('container_name_cosmos')
 
-async def get_cosmos_client():
-    return CosmosClient(endpoint, credential=key)
-
 async def get_or_create_database(client, database_name):
     try:
         database = client.get_database_client(database_name)
@@ -34,13 +36,193 @@ async def get_or_create_container(database, container_name):
         print(f"Container '{container_name}' created")
     return container
 
-async def write_harti_data_to_cosmosdb(harti_data_dict):
+class CosmosBulkWriter:
+    """
+    Upserts a stream of documents with transactional batches and bounded, adaptive concurrency.
+    
+    Documents are grouped by partition key value into transactional batches of up to batch_size upserts,
+    and at most `concurrency` batches are in flight at a time. When Cosmos DB throttles (429) after the
+    SDK's own retries, the writer waits for the advised retry-after time and halves its concurrency; it
+    grows it again by one after every successful round of batches (AIMD), up to max_concurrency.
+    Documents can be any iterable or async iterable, so they are written while they are being produced.
+    """
+
+    def __init__(self, container, max_concurrency=COSMOS_MAX_CONCURRENCY, batch_size=COSMOS_BATCH_SIZE, partition_key_path=None):
+        self.container = container
+        self.max_concurrency = max_concurrency
+        self.concurrency = max_concurrency
+        self.batch_size = min(batch_size, 100) # cosmos allows at most 100 operations per transactional batch
+        self.partition_key_path = partition_key_path
+        self.in_flight = 0
+        self.slot_released = asyncio.Condition()
+        self.documents_written = 0
+        self.batches_written = 0
+        self.throttled = 0
+        self.request_charge = 0.0
+
+    async def get_partition_key_path(self):
+        if self.partition_key_path is None:
+            container_properties = await self.container.read()
+            self.partition_key_path = container_properties['partitionKey']['paths'][0]
+        return self.partition_key_path
+
+    def get_partition_key(self, document):
+        # documents without the partition key property live in the 'none' partition
+        value = document
+        for part in self.partition_key_path.strip('/').split('/'):
+            if not isinstance(value, dict) or part not in value:
+                return NonePartitionKeyValue
+            value = value[part]
+        return value
+
+    def add_request_charge(self, response_headers, _):
+        self.request_charge += float(response_headers.get('x-ms-request-charge', 0))
+
+    async def write_batch(self, partition_key, documents):
+        operations = [('upsert', (document,)) for document in documents]
+        while True:
+            async with self.slot_released:
+                await self.slot_released.wait_for(lambda: self.in_flight < self.concurrency)
+                self.in_flight += 1
+            try:
+                await self.container.execute_item_batch(operations, partition_key=partition_key, response_hook=self.add_request_charge)
+            except exceptions.CosmosHttpResponseError as e:
+                if e.status_code != 429:
+                    raise
+                self.throttled += 1
+                self.concurrency = max(1, self.concurrency // 2)
+                retry_after_ms = float(e.headers.get('x-ms-retry-after-ms', 1000)) if e.headers else 1000
+                logging.warning(f"Cosmos DB throttled a batch, retrying in {retry_after_ms:.0f}ms with concurrency {self.concurrency}")
+                await asyncio.sleep(retry_after_ms / 1000)
+                continue
+            finally:
+                async with self.slot_released:
+                    self.in_flight -= 1
+                    self.slot_released.notify_all()
+
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            self.documents_written += len(documents)
+            self.batches_written += 1
+            return
+
+    async def write(self, documents):
+        """
+        Upserts all documents.
+        
+        Parameters:
+        - documents: An iterable or async iterable of documents (dicts).
+        
+        Returns:
+        - A dict with the throughput statistics of this call.
+        """
+        await self.get_partition_key_path()
+        start_time = time.perf_counter()
+        documents_before = self.documents_written
+        pending_batches = {}
+        tasks = set()
+
+        def flush(partition_key):
+            batch = pending_batches.pop(partition_key)
+            task = asyncio.ensure_future(self.write_batch(partition_key, batch))
+            tasks.add(task)
+
+        async def add(document):
+            partition_key = self.get_partition_key(document)
+            pending_batches.setdefault(partition_key, []).append(document)
+            if len(pending_batches[partition_key]) >= self.batch_size:
+                flush(partition_key)
+                # back pressure: do not buffer more batches than can be written
+                finished = [task for task in tasks if task.done()]
+                for task in finished:
+                    tasks.discard(task)
+                    task.result()
+                if len(tasks) >= 2 * self.max_concurrency:
+                    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        tasks.discard(task)
+                        task.result()
+
+        try:
+            if hasattr(documents, '__aiter__'):
+                async for document in documents:
+                    await add(document)
+            else:
+                for document in documents:
+                    await add(document)
+            for partition_key in list(pending_batches):
+                flush(partition_key)
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        seconds = time.perf_counter() - start_time
+        documents_written = self.documents_written - documents_before
+        stats = {
+            'documents': documents_written,
+            'seconds': seconds,
+            'documents_per_second': documents_written / seconds if seconds else 0.0,
+            'request_charge': self.request_charge,
+            'throttled': self.throttled,
+        }
+        logging.info(f"Cosmos DB: upserted {documents_written} documents in {seconds:.2f}s "
+                     f"({stats['documents_per_second']:.0f} docs/s, {self.request_charge:.0f} RU so far, throttled {self.throttled} times)")
+        return stats
+
+class CosmosConnection:
+    """
+    Run scoped Cosmos DB connection.
+    
+    The client is created once (one TLS connection pool for the whole run), the database and container are
+    checked / created once on first use, and everything is closed at shutdown.
+    
+    Usage:
+        async with CosmosConnection() as cosmos_connection:
+            await write_harti_data_to_cosmosdb(documents, cosmos_connection)
+    """
+
+    def __init__(self, endpoint=endpoint, key=key, database_name=database_name, container_name=container_name_cosmos):
+        self.endpoint = endpoint
+        self.key = key
+        self.database_name = database_name
+        self.container_name = container_name
+        self.client = None
+        self.container = None
+        self.writer = None
+        self.open_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def get_container(self):
+        async with self.open_lock: # concurrent pdfs must not open the connection twice
+            if self.container is None:
+                self.client = CosmosClient(self.endpoint, credential=self.key)
+                database = await get_or_create_database(self.client, self.database_name)
+                self.container = await get_or_create_container(database, self.container_name)
+                self.writer = CosmosBulkWriter(self.container)
+        return self.container
+
+    async def get_writer(self):
+        await self.get_container()
+        return self.writer
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+            self.container = None
+            self.writer = None
 
-    client = await get_cosmos_client()
-    async with CosmosClient(endpoint, credential=key) as client:
-        database = await get_or_create_database(client, database_name)
-        container = await get_or_create_container(database, container_name_cosmos)
+async def write_harti_data_to_cosmosdb(harti_data_dict, cosmos_connection=None):
 
-        for rate in harti_data_dict:
-            await container.upsert_item(rate)
+    if cosmos_connection is None:
+        async with CosmosConnection() as cosmos_connection:
+            return await write_harti_data_to_cosmosdb(harti_data_dict, cosmos_connection)
 
+    writer = await cosmos_connection.get_writer()
+    return await writer.write(harti_data_dict)
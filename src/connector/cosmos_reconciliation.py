@@ -0,0 +1,133 @@
+# cosmos_reconciliation.py
+# Finds and removes duplicate price documents in the Cosmos DB container.
+#
+# Before documents had deterministic ids (see cosmos_document_id), every re-ingestion of a bulletin inserted a new copy
+# of its documents under a random id. This tool groups all documents by their deterministic id, keeps the most recently
+# written document of every group (stored under the deterministic id, so later re-ingestions overwrite it) and deletes
+# the other copies.
+#
+# The page is part of the grouping: a bulletin's tables can span several pages and every row is stored with its page,
+# so rows of the same date / location / item on different pages are different prices. Legacy documents (all stored
+# with page 2) are therefore not merged with copies of the same row written later with page 1; those are left as is.
+# The container is streamed: only the kept document of every group (and just its id once it is stored under its
+# deterministic id) and the id / partition key of the copies to delete are held in memory.
+#
+# usage (from the repo root):
+#   python -m src.connector.cosmos_reconciliation            dry run, only reports the duplicates
+#   python -m src.connector.cosmos_reconciliation --apply    removes them
+import argparse
+import asyncio
+import logging
+from src.configuration.configuration import COSMOS_DOCUMENT_ID_MODE, COSMOS_MAX_CONCURRENCY
+from src.connector.cosmos_db import CosmosConnection
+from src.pipeline2.data_format_converter import COSMOS_DOCUMENT_CONTENT_FIELDS, cosmos_document_id
+
+# properties cosmos adds to every document, they must not be written back
+SYSTEM_PROPERTIES = ('_rid', '_self', '_etag', '_attachments', '_ts')
+
+class ReconciliationPlan:
+    """
+    Groups the documents of the container, as they are read, by their deterministic id and decides
+    what to keep.
+
+    Usage:
+        plan = ReconciliationPlan(id_mode, writer.get_partition_key)
+        async for document in container.read_all_items():
+            plan.add(document)
+        documents_to_upsert, documents_to_delete, groups = plan.result()
+    """
+
+    def __init__(self, id_mode=COSMOS_DOCUMENT_ID_MODE, partition_key=lambda document: None):
+        if id_mode == 'random':
+            raise ValueError("Duplicates can only be reconciled with deterministic ids (cosmos_document_id_mode 'key' or 'content')")
+        self.id_mode = id_mode
+        self.partition_key = partition_key
+        self.kept = {}
+        self.copies = []
+        self.documents = 0
+        self.skipped = 0
+
+    def add(self, document):
+        self.documents += 1
+        if any(field not in document for field in COSMOS_DOCUMENT_CONTENT_FIELDS):
+            self.skipped += 1
+            return
+        group = document_id = cosmos_document_id(document, self.id_mode)
+        copy = {'id': document['id'], 'partition_key': self.partition_key(document), 'group': group}
+        # most recently written copy wins, a copy already stored under the deterministic id wins ties
+        kept = {
+            'rank': (document.get('_ts', 0), document['id'] == document_id),
+            'id': document_id,
+            'copy': copy,
+            # the full document is only needed if it has to be stored under its deterministic id
+            'document': None if document['id'] == document_id else {name: value for name, value in document.items() if name not in SYSTEM_PROPERTIES},
+        }
+        previous = self.kept.get(group)
+        if previous is None or kept['rank'] > previous['rank']:
+            self.kept[group] = kept
+            if previous is not None:
+                self.copies.append(previous['copy'])
+        else:
+            self.copies.append(copy)
+
+    def result(self):
+        """
+        Returns:
+        - documents_to_upsert: the kept document of every group that is not stored under its deterministic id yet.
+        - documents_to_delete: every other copy, as {'id', 'partition_key', 'group'}.
+        - groups: number of distinct documents.
+        """
+        if self.skipped:
+            logging.warning(f"Skipped {self.skipped} documents that are not price documents")
+        documents_to_upsert = []
+        documents_to_delete = []
+        for kept in self.kept.values():
+            if kept['document'] is not None:
+                documents_to_upsert.append(dict(kept['document'], id=kept['id']))
+                documents_to_delete.append(kept['copy'])
+        # a copy already stored under the kept document's id is overwritten by the upsert, not deleted
+        documents_to_delete += [copy for copy in self.copies if copy['id'] != self.kept[copy['group']]['id']]
+        return documents_to_upsert, documents_to_delete, len(self.kept)
+
+def plan_reconciliation(documents, id_mode=COSMOS_DOCUMENT_ID_MODE, partition_key=lambda document: None):
+    """Plans the reconciliation of an iterable of documents, see ReconciliationPlan"""
+    plan = ReconciliationPlan(id_mode, partition_key)
+    for document in documents:
+        plan.add(document)
+    return plan.result()
+
+async def reconcile(apply=False, id_mode=COSMOS_DOCUMENT_ID_MODE, max_concurrency=COSMOS_MAX_CONCURRENCY):
+    async with CosmosConnection() as cosmos_connection:
+        container = await cosmos_connection.get_container()
+        writer = await cosmos_connection.get_writer()
+        await writer.get_partition_key_path()
+
+        plan = ReconciliationPlan(id_mode, writer.get_partition_key)
+        async for document in container.read_all_items():
+            plan.add(document)
+        documents_to_upsert, documents_to_delete, groups = plan.result()
+        logging.info(f"{plan.documents} documents, {groups} distinct: {len(documents_to_delete)} duplicates to delete, "
+                     f"{len(documents_to_upsert)} documents to store under their deterministic id")
+        if not apply:
+            logging.info("Dry run, nothing changed (use --apply to remove the duplicates)")
+            return documents_to_upsert, documents_to_delete
+
+        # the kept documents are written under their deterministic id before any copy is deleted
+        await writer.write(documents_to_upsert)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        async def delete(copy):
+            async with semaphore:
+                await container.delete_item(copy['id'], partition_key=copy['partition_key'])
+        await asyncio.gather(*(delete(copy) for copy in documents_to_delete))
+        logging.info(f"Deleted {len(documents_to_delete)} duplicate documents")
+        return documents_to_upsert, documents_to_delete
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Find and remove duplicate price documents in Cosmos DB. Copies of the same '
+                                     'date / location / item / page are duplicates.')
+    parser.add_argument('--apply', action='store_true', help='delete the duplicates (default: dry run)')
+    parser.add_argument('--id-mode', default=COSMOS_DOCUMENT_ID_MODE, choices=['key', 'content'])
+    args = parser.parse_args()
+    asyncio.run(reconcile(apply=args.apply, id_mode=args.id_mode))
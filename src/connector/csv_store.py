@@ -0,0 +1,276 @@
+# csv_store.py
+# Append only storage of the monthly wholesale price CSV files (year-monthpage2.csv).
+#
+# Every bulletin is written as one block of the monthly file: the first block is the CSV header, every following
+# block holds the rows of one bulletin. Uploading a bulletin therefore only sends its own rows, instead of downloading
+# and re-uploading the whole month. compact() rewrites a monthly file into the clean layout of the old
+# download-and-rewrite upload (one header, newest bulletin first, one block per bulletin date).
+import argparse
+import json
+import logging
+import os
+import tempfile
+import uuid
+from datetime import datetime
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import BlobBlock, BlobServiceClient
+from dotenv import load_dotenv
+from src.configuration.configuration import CSV_STORE_BACKEND, CSV_STORE_LOCAL_DIR
+
+load_dotenv()
+
+connect_str = os.getenv('connect_str')
+container_name_blob = os.getenv('container_name_blob')
+
+HEADER_BLOCK_ID = 'header:' + '0' * 36
+LEGACY_BLOCK_ID = 'legacy:' + '0' * 36
+
+def monthly_csv_file_name(actual_date_str):
+    """Returns the name of the monthly CSV file a bulletin of the given date (YYYY-MM-DD) belongs to. eg: 2024-10page2.csv
+    """
+    date_object = datetime.strptime(actual_date_str, '%Y-%m-%d')
+    return str(date_object.year) + '-' + str(date_object.month) + 'page2.csv'
+
+def new_block_id(actual_date_str):
+    # all block ids of a blob must have the same length: 10 (date) + 1 + 32 (uuid) characters, same as the header id
+    return actual_date_str + ':' + uuid.uuid4().hex
+
+def split_header(csv_data):
+    header, _, rows = csv_data.partition('\n')
+    return header + '\n', rows
+
+class MonthlyCsvStore:
+    """
+    Base class of the monthly CSV storage backends.
+
+    A backend stores a file as an ordered list of (block_id, bytes) blocks and implements get_blocks, read,
+    append_block and replace. The block ids keep the bulletin date of every block, so compaction can order
+    the bulletins and drop duplicate uploads of the same bulletin without parsing the CSV.
+    """
+    name = None
+
+    def get_blocks(self, file_name):
+        """Returns the committed [(block_id, size)] of file_name in file order, [] if it does not exist.
+        A file that exists but was not written block wise (old download-and-rewrite upload) returns None.
+        """
+        raise NotImplementedError
+
+    def read(self, file_name):
+        raise NotImplementedError
+
+    def append_block(self, file_name, block_id, data, existing_block_ids):
+        raise NotImplementedError
+
+    def replace(self, file_name, blocks):
+        """Overwrites file_name with the given [(block_id, bytes)] blocks"""
+        raise NotImplementedError
+
+    def list_files(self):
+        raise NotImplementedError
+
+    def read_blocks(self, file_name):
+        """Returns the [(block_id, bytes)] blocks of file_name"""
+        blocks = self.get_blocks(file_name)
+        if not blocks:
+            return []
+        content = self.read(file_name)
+        result = []
+        offset = 0
+        for block_id, size in blocks:
+            result.append((block_id, content[offset:offset + size]))
+            offset += size
+        return result
+
+    def migrate_legacy_file(self, file_name):
+        # a file written by the old upload is turned into a header block and one block holding all of its rows
+        header, rows = split_header(self.read(file_name).decode('utf-8'))
+        blocks = [(HEADER_BLOCK_ID, header.encode('utf-8'))]
+        if rows:
+            blocks.append((LEGACY_BLOCK_ID, rows.encode('utf-8')))
+        self.replace(file_name, blocks)
+        logging.info(f"Converted {file_name} to block wise storage")
+        return [block_id for block_id, _ in blocks]
+
+    def append(self, csv_data, actual_date_str):
+        """Appends the rows of one bulletin (csv_data including its header row) to its monthly file.
+        Returns the file name.
+        """
+        file_name = monthly_csv_file_name(actual_date_str)
+        header, rows = split_header(csv_data)
+
+        blocks = self.get_blocks(file_name)
+        if blocks is None:
+            block_ids = self.migrate_legacy_file(file_name)
+        else:
+            block_ids = [block_id for block_id, _ in blocks]
+        if not block_ids:
+            # the header is written once, when the monthly file is created
+            self.append_block(file_name, HEADER_BLOCK_ID, header.encode('utf-8'), block_ids)
+            block_ids = [HEADER_BLOCK_ID]
+
+        self.append_block(file_name, new_block_id(actual_date_str), rows.encode('utf-8'), block_ids)
+        logging.info(f"Appended {len(rows.encode('utf-8'))} bytes to {file_name} ({len(block_ids)} blocks before) on {self.name}")
+        return file_name
+
+    def compact(self, file_name):
+        """Rewrites file_name as one header followed by the bulletins newest first, keeping only the latest upload
+        of every bulletin date. Returns the number of blocks dropped.
+        """
+        blocks = self.get_blocks(file_name)
+        if blocks is None:
+            self.migrate_legacy_file(file_name)
+        blocks = self.read_blocks(file_name)
+        if not blocks:
+            return 0
+
+        header = None
+        legacy = None
+        latest_by_date = {}
+        for block_id, data in blocks:
+            if block_id == HEADER_BLOCK_ID:
+                header = data
+            elif block_id == LEGACY_BLOCK_ID:
+                legacy = data
+            else:
+                # later blocks of the same bulletin date are re-uploads and replace the earlier ones
+                latest_by_date[block_id.split(':')[0]] = (block_id, data)
+
+        compacted = [(HEADER_BLOCK_ID, header)]
+        compacted += [latest_by_date[date] for date in sorted(latest_by_date, reverse=True)]
+        if legacy is not None:
+            # rows converted from the old layout were uploaded before any appended bulletin
+            compacted.append((LEGACY_BLOCK_ID, legacy))
+
+        self.replace(file_name, compacted)
+        dropped = len(blocks) - len(compacted)
+        logging.info(f"Compacted {file_name}: {len(compacted) - 1} row blocks kept, {dropped} dropped")
+        return dropped
+
+class AzureBlobCsvStore(MonthlyCsvStore):
+    """
+    Monthly CSV files as Azure block blobs. Every append stages one block and commits the block list,
+    so only the new rows are sent. Works the same against Azurite (use its connection string as connect_str).
+    """
+    name = 'azure'
+
+    def __init__(self, connection_string=connect_str, container_name=container_name_blob):
+        blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+        self.container_client = blob_service_client.get_container_client(container=container_name)
+
+    def get_blocks(self, file_name):
+        blob_client = self.container_client.get_blob_client(file_name)
+        try:
+            committed, _ = blob_client.get_block_list('committed')
+        except ResourceNotFoundError:
+            return []
+        if not committed:
+            # blobs uploaded in a single request (the old upload) have no block list
+            return None
+        return [(block.id, block.size) for block in committed]
+
+    def read(self, file_name):
+        return self.container_client.download_blob(file_name).readall()
+
+    def append_block(self, file_name, block_id, data, existing_block_ids):
+        blob_client = self.container_client.get_blob_client(file_name)
+        blob_client.stage_block(block_id, data, length=len(data))
+        blob_client.commit_block_list([BlobBlock(block_id=existing_id) for existing_id in existing_block_ids] + [BlobBlock(block_id=block_id)])
+
+    def replace(self, file_name, blocks):
+        blob_client = self.container_client.get_blob_client(file_name)
+        for block_id, data in blocks:
+            blob_client.stage_block(block_id, data, length=len(data))
+        blob_client.commit_block_list([BlobBlock(block_id=block_id) for block_id, _ in blocks])
+
+    def list_files(self):
+        return [blob.name for blob in self.container_client.list_blobs() if blob.name.endswith('page2.csv')]
+
+class LocalCsvStore(MonthlyCsvStore):
+    """
+    Monthly CSV files in a local directory, for offline runs and tests. The CSV file is appended to in place and
+    a <file>.blocks.json sidecar keeps its block list.
+    """
+    name = 'local'
+
+    def __init__(self, directory=CSV_STORE_LOCAL_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    def blocks_path(self, file_name):
+        return self.path(file_name) + '.blocks.json'
+
+    def get_blocks(self, file_name):
+        if not os.path.exists(self.path(file_name)):
+            return []
+        try:
+            with open(self.blocks_path(file_name), encoding='utf-8') as f:
+                return [tuple(block) for block in json.load(f)]
+        except FileNotFoundError:
+            return None
+
+    def write_blocks(self, file_name, blocks):
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as f:
+            json.dump(blocks, f)
+        os.replace(temporary_path, self.blocks_path(file_name))
+
+    def read(self, file_name):
+        with open(self.path(file_name), 'rb') as f:
+            return f.read()
+
+    def append_block(self, file_name, block_id, data, existing_block_ids):
+        blocks = self.get_blocks(file_name) or []
+        path = self.path(file_name)
+        committed_size = sum(size for _, size in blocks)
+        with open(path, 'ab') as f:
+            # drop bytes of an append that crashed before its block was recorded
+            f.truncate(committed_size)
+            f.write(data)
+        self.write_blocks(file_name, blocks + [(block_id, len(data))])
+
+    def replace(self, file_name, blocks):
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'wb') as f:
+            for _, data in blocks:
+                f.write(data)
+        os.replace(temporary_path, self.path(file_name))
+        self.write_blocks(file_name, [(block_id, len(data)) for block_id, data in blocks])
+
+    def list_files(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('page2.csv'))
+
+CSV_STORES = {
+    AzureBlobCsvStore.name: AzureBlobCsvStore,
+    LocalCsvStore.name: LocalCsvStore,
+}
+
+def get_csv_store(name=None):
+    """Returns the monthly CSV store configured with csv_store_backend (or the given name)
+    """
+    name = name or CSV_STORE_BACKEND
+    try:
+        return CSV_STORES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown csv store backend '{name}', expected one of {sorted(CSV_STORES)}")
+
+if __name__ == "__main__":
+    # python -m src.connector.csv_store compact 2024-2page2.csv   /   python -m src.connector.csv_store compact --all
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Compact the append only monthly CSV files')
+    parser.add_argument('command', choices=['compact', 'list'])
+    parser.add_argument('file_names', nargs='*')
+    parser.add_argument('--all', action='store_true', help='compact every monthly CSV file')
+    parser.add_argument('--backend', default=None, help=f"one of {sorted(CSV_STORES)} (default: csv_store_backend)")
+    args = parser.parse_args()
+
+    store = get_csv_store(args.backend)
+    if args.command == 'list':
+        for file_name in store.list_files():
+            blocks = store.get_blocks(file_name)
+            print(file_name, 'legacy' if blocks is None else f"{len(blocks)} blocks")
+    else:
+        for file_name in (store.list_files() if args.all else args.file_names):
+            store.compact(file_name)
@@ -0,0 +1,125 @@
+# http_client.py
+# Shared async HTTP layer for the whole run (link discovery and PDF downloads).
+import asyncio
+import aiohttp
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential
+from src.configuration.configuration import (
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_CONNECTIONS_PER_HOST, HTTP_TIMEOUT_SECONDS, HTTP_RETRY_ATTEMPTS
+)
+
+# connection errors, 5xx responses and timeouts are worth another try, 4xx responses are not.
+# An aiohttp.ClientError, so callers handle a 5xx that outlasted the retries like every other HTTP failure
+class TransientHttpError(aiohttp.ClientError):
+    pass
+
+class HttpClient:
+    """
+    One pooled aiohttp session for the whole run.
+    
+    Connections are kept alive and reused between requests, the number of open connections is limited
+    overall and per host, every request has a connect / read / total timeout, and response bodies are
+    read in chunks. Transient failures are retried with exponential backoff.
+    
+    Usage:
+        async with HttpClient() as http_client:
+            pdf_content = await http_client.get_bytes(pdf_url)
+    """
+
+    def __init__(self, max_connections=HTTP_MAX_CONNECTIONS, max_connections_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+                 timeout_seconds=HTTP_TIMEOUT_SECONDS, retry_attempts=HTTP_RETRY_ATTEMPTS, chunk_size=64 * 1024):
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout_seconds, sock_connect=min(10, timeout_seconds), sock_read=timeout_seconds / 2)
+        self.retry_attempts = retry_attempts
+        self.chunk_size = chunk_size
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def open(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=30,
+                ttl_dns_cache=300,
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, raise_for_status=False)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _with_retries(self, request_coroutine_function, *args):
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.retry_attempts),
+            wait=wait_exponential(multiplier=1, max=10),
+            retry=retry_if_exception_type((aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError, TransientHttpError)),
+            reraise=True,
+        ):
+            with attempt:
+                return await request_coroutine_function(*args)
+
+    async def _read_response(self, response):
+        if response.status >= 500:
+            raise TransientHttpError(f"{response.status} {response.reason} for {response.url}")
+        response.raise_for_status()
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            body.extend(chunk)
+        return bytes(body)
+
+    async def _get_bytes(self, url, headers=None):
+        await self.open()
+        async with self.session.get(url, headers=headers) as response:
+            return await self._read_response(response)
+
+    async def _get(self, url, headers=None):
+        await self.open()
+        async with self.session.get(url, headers=headers) as response:
+            if response.status == 304:
+                return response.status, response.headers, b''
+            return response.status, response.headers, await self._read_response(response)
+
+    async def _download(self, url, spool, headers=None):
+        await self.open()
+        spool.reset() # a retried attempt starts over
+        async with self.session.get(url, headers=headers) as response:
+            if response.status == 304:
+                return response.status, response.headers
+            if response.status >= 500:
+                raise TransientHttpError(f"{response.status} {response.reason} for {response.url}")
+            response.raise_for_status()
+            if response.content_length is not None:
+                spool.check_size(response.content_length) # refused before anything is downloaded
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                spool.write(chunk)
+            spool.finish()
+            return response.status, response.headers
+
+    async def get_bytes(self, url, headers=None) -> bytes:
+        """Downloads the body of url (streamed in chunks), raising aiohttp.ClientError / asyncio.TimeoutError on failure
+        """
+        return await self._with_retries(self._get_bytes, url, headers)
+
+    async def get(self, url, headers=None):
+        """Like get_bytes, but also returns the status and the response headers: (status, headers, body).
+        A 304 Not Modified answer to a conditional request is returned with an empty body instead of raising.
+        """
+        return await self._with_retries(self._get, url, headers)
+
+    async def download(self, url, spool, headers=None):
+        """Streams the body of url into spool (a SpooledPdf, see src/connector/pdf_spool.py) instead of holding it in memory.
+        Returns (status, headers), a 304 Not Modified answer leaves spool empty.
+        """
+        return await self._with_retries(self._download, url, spool, headers)
+
+    async def get_text(self, url, headers=None, encoding='utf-8') -> str:
+        content = await self.get_bytes(url, headers)
+        return content.decode(encoding, errors='replace')
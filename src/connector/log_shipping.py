@@ -0,0 +1,95 @@
+# log_shipping.py
+# Ships the log messages of a run to blob storage while the run is going on.
+#
+# Every run gets one append blob (log<timestamp>.txt, same names as before). A background thread drains the bounded
+# log buffer of src/logHandling.py every log_flush_interval_seconds and appends the drained messages to the blob,
+# so neither memory nor the final flush at shutdown grows with the length of the run.
+import logging
+import os
+import sys
+import threading
+from azure.storage.blob import BlobServiceClient
+from dotenv import load_dotenv
+from src.configuration.configuration import LOG_FILE_NAME, LOG_FILE_EXTENSION, LOG_FLUSH_INTERVAL_SECONDS
+from src.connector.blob import delete_old_run_files, new_run_file_name
+from src.logHandling import log_buffer_handler
+
+load_dotenv()
+
+connect_str = os.getenv('connect_str')
+container_name_blob = os.getenv('container_name_blob')
+
+# append blob blocks are limited to 4 MiB
+MAX_APPEND_BLOCK_BYTES = 4 * 1024 * 1024
+
+class LogShipper:
+    """
+    Streams the buffered log messages of the run to its log blob.
+
+    Usage:
+        log_shipper = LogShipper().start()   # rotates the old log files and creates the log blob of this run
+        ...
+        log_shipper.close()                  # ships the messages logged since the last flush
+    """
+
+    def __init__(self, log_buffer=log_buffer_handler, flush_interval=LOG_FLUSH_INTERVAL_SECONDS,
+                 connection_string=connect_str, container_name=container_name_blob):
+        self.log_buffer = log_buffer
+        self.flush_interval = flush_interval
+        self.connection_string = connection_string
+        self.container_name = container_name
+        self.blob_client = None
+        self.flush_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        blob_service_client = BlobServiceClient.from_connection_string(self.connection_string)
+        container_client = blob_service_client.get_container_client(container=self.container_name)
+
+        # each run will generate a log file. We will only store the most recent NUMBER_OF_LOG_FILES_TO_KEEP log files in the blob.
+        delete_old_run_files(container_client, LOG_FILE_NAME, LOG_FILE_EXTENSION)
+
+        self.blob_client = container_client.get_blob_client(new_run_file_name(LOG_FILE_NAME, LOG_FILE_EXTENSION))
+        self.blob_client.create_append_blob()
+
+        self.thread = threading.Thread(target=self.run, name='log-shipper', daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Appends the messages buffered since the last flush to the log blob"""
+        with self.flush_lock:
+            messages, dropped = self.log_buffer.drain()
+            if dropped:
+                messages.insert(0, f"[{dropped} log messages dropped, the log buffer was full]")
+            if not messages:
+                return
+            data = ('\n'.join(messages) + '\n').encode('utf-8')
+            try:
+                for offset in range(0, len(data), MAX_APPEND_BLOCK_BYTES):
+                    self.blob_client.append_block(data[offset:offset + MAX_APPEND_BLOCK_BYTES])
+            except Exception as e:
+                # not logged, the message would only end up in the buffer that failed to ship
+                print(f"Could not ship {len(messages)} log messages: {e}", file=sys.stderr)
+
+    def close(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        if self.blob_client is not None:
+            self.flush()
+
+def start_log_shipping():
+    """Starts shipping the logs of this run, returns None (logs only go to the terminal) if blob storage is not reachable
+    """
+    try:
+        return LogShipper().start()
+    except Exception as e:
+        logging.error(f"Exception when starting the log shipping: {e}")
+        return None
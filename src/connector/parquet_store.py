@@ -0,0 +1,151 @@
+# parquet_store.py
+# Columnar copy of the wholesale prices, next to the monthly CSV files: a Parquet dataset partitioned by
+# year / month (of the price date) / Page, in hive layout (year=2024/month=2/Page=2/bulletin-2024-02-01.parquet).
+#
+# Columns are typed (dates as date32, prices as int32) and Location / Item_Names are dictionary encoded, so readers
+# load years of history with pyarrow / pandas in seconds instead of parsing the CSV text of every month.
+# Every bulletin only writes its own file in each partition it has rows for: existing partitions are never rewritten,
+# and re-ingesting a bulletin overwrites just its own files.
+#
+# Reading (local dataset): pd.read_parquet('parquet_store') or read_parquet_dataset('parquet_store')
+import io
+import logging
+import os
+import tempfile
+from azure.storage.blob import BlobServiceClient
+from dotenv import load_dotenv
+from src.configuration.configuration import PARQUET_STORE_BACKEND, PARQUET_STORE_LOCAL_DIR, PARQUET_STORE_BLOB_PREFIX
+from src.pipeline2.data_format_converter import bulletin_date_string
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # only needed when the parquet output is enabled
+    pa = None
+    pq = None
+
+load_dotenv()
+
+connect_str = os.getenv('connect_str')
+container_name_blob = os.getenv('container_name_blob')
+
+def parquet_schema():
+    return pa.schema([
+        ('Database Write Date', pa.date32()),
+        ('Date', pa.date32()),
+        ('Location', pa.dictionary(pa.int32(), pa.string())),
+        ('Item_Names', pa.dictionary(pa.int32(), pa.string())),
+        ('Value', pa.string()),
+        ('Min_Value', pa.int32()),
+        ('Max_Value', pa.int32()),
+    ])
+
+def dataframe_to_arrow_table(food_df):
+    """Converts the transformed DataFrame of a bulletin to an Arrow table with the dataset schema (without the partition columns)
+    """
+    columns = food_df.drop(columns=['Page']).copy()
+    columns['Database Write Date'] = columns['Database Write Date'].astype('datetime64[ns]').dt.date
+    columns['Date'] = columns['Date'].astype('datetime64[ns]').dt.date
+    return pa.Table.from_pandas(columns, schema=parquet_schema(), preserve_index=False)
+
+def partition_path(year, month, page):
+    return f'year={year}/month={month}/Page={page}'
+
+def split_into_partitions(food_df):
+    """Returns [(partition path, Arrow table)] of the rows of one bulletin
+    """
+    dates = food_df['Date'].astype('datetime64[ns]')
+    partitions = []
+    for (year, month, page), rows in food_df.groupby([dates.dt.year, dates.dt.month, food_df['Page']], sort=True):
+        partitions.append((partition_path(year, month, page), dataframe_to_arrow_table(rows)))
+    return partitions
+
+def table_to_parquet_bytes(table):
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression='snappy')
+    return buffer.getvalue()
+
+class ParquetStore:
+    """
+    Base class of the parquet dataset backends, which implement write_file(path, data).
+    """
+    name = None
+
+    def __init__(self):
+        if pa is None:
+            raise ImportError("The parquet output needs pyarrow (pip install pyarrow)")
+
+    def write_file(self, path, data):
+        raise NotImplementedError
+
+    def append(self, food_df):
+        """Writes the rows of one bulletin into their partitions. Returns the written file paths.
+        """
+        file_name = f'bulletin-{bulletin_date_string(food_df)}.parquet'
+        paths = []
+        for partition, table in split_into_partitions(food_df):
+            path = partition + '/' + file_name
+            self.write_file(path, table_to_parquet_bytes(table))
+            paths.append(path)
+        logging.info(f"Wrote {len(food_df)} rows to {len(paths)} parquet partitions on {self.name}")
+        return paths
+
+class AzureBlobParquetStore(ParquetStore):
+    """
+    Parquet dataset under a prefix of the blob container (works the same against Azurite).
+    """
+    name = 'azure'
+
+    def __init__(self, connection_string=connect_str, container_name=container_name_blob, prefix=PARQUET_STORE_BLOB_PREFIX):
+        super().__init__()
+        blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+        self.container_client = blob_service_client.get_container_client(container=container_name)
+        self.prefix = prefix
+
+    def write_file(self, path, data):
+        self.container_client.upload_blob(name=self.prefix + '/' + path, data=data, overwrite=True)
+
+class LocalParquetStore(ParquetStore):
+    """
+    Parquet dataset in a local directory.
+    """
+    name = 'local'
+
+    def __init__(self, directory=PARQUET_STORE_LOCAL_DIR):
+        super().__init__()
+        self.directory = directory
+
+    def write_file(self, path, data):
+        full_path = os.path.join(self.directory, *path.split('/'))
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # readers never see a partly written file
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(full_path), suffix='.tmp')
+        with os.fdopen(file_descriptor, 'wb') as f:
+            f.write(data)
+        os.replace(temporary_path, full_path)
+
+PARQUET_STORES = {
+    AzureBlobParquetStore.name: AzureBlobParquetStore,
+    LocalParquetStore.name: LocalParquetStore,
+}
+
+def get_parquet_store(name=None):
+    """Returns the parquet store configured with parquet_store_backend (or the given name)
+    """
+    name = name or PARQUET_STORE_BACKEND
+    if not name:
+        raise ValueError("The parquet output is disabled (set parquet_store_backend)")
+    try:
+        return PARQUET_STORES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown parquet store backend '{name}', expected one of {sorted(PARQUET_STORES)}")
+
+def read_parquet_dataset(directory=PARQUET_STORE_LOCAL_DIR, columns=None, filters=None):
+    """Reads a local parquet dataset into a DataFrame, with the year / month / Page partition columns.
+    filters prune whole partitions before reading, eg: [('year', '>=', 2023)]
+    """
+    import pyarrow.dataset as ds
+    partition_schema = pa.schema([('year', pa.int16()), ('month', pa.int8()), ('Page', pa.int16())])
+    schema = pa.unify_schemas([parquet_schema(), partition_schema])
+    dataset = ds.dataset(directory, format='parquet', schema=schema, partitioning=ds.partitioning(partition_schema, flavor='hive'))
+    return dataset.to_table(columns=columns, filter=pq.filters_to_expression(filters) if filters else None).to_pandas(date_as_object=False)
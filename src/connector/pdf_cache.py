@@ -0,0 +1,208 @@
+# pdf_cache.py
+# Content-addressed on-disk cache of downloaded bulletin PDFs, so reprocessing / backfills do not hit harti.gov.lk again.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from src.configuration.configuration import PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES
+from src.connector.pdf_spool import SpooledPdf
+
+INDEX_FILE_NAME = 'index.json'
+
+def file_sha256(path):
+    # read in chunks, the cached pdf is never loaded into memory as a whole
+    sha256 = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+    except FileNotFoundError:
+        return None
+    return sha256.hexdigest()
+
+class PdfCache:
+    """
+    On-disk cache of PDFs keyed by URL.
+    
+    The content is stored once per SHA-256 hash under objects/ (identical PDFs served from several URLs are
+    stored once), and index.json maps every URL to its hash, size, ETag / Last-Modified validators and last
+    access time. A cached URL is revalidated with a conditional request (If-None-Match / If-Modified-Since),
+    so an unchanged PDF is never downloaded twice. When the cache grows beyond max_bytes the least recently
+    used entries are evicted, except the ones handed out during the run (their files may still be opened by path
+    in a worker process): those are pinned until close().
+
+    read / store hash and move whole files, fetch runs them in a thread so the event loop keeps serving the other
+    downloads; the index is guarded by a lock.
+    """
+
+    def __init__(self, cache_dir=PDF_CACHE_DIR, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_path = os.path.join(cache_dir, INDEX_FILE_NAME)
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = self._load_index()
+        self.lock = threading.Lock()
+        # sha256 of the objects handed out during the run, never evicted before close()
+        self.pinned = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logging.warning(f"PDF cache index {self.index_path} is corrupt, starting with an empty cache")
+            return {}
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        # write to a temporary file first so a crash never leaves a half written index behind
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f)
+        os.replace(temporary_path, self.index_path)
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256 + '.pdf')
+
+    def read(self, url):
+        """Returns the cached copy of url as a SpooledPdf reading the cache file in place, or None if it is not cached
+        (or the cached file is damaged)
+        """
+        with self.lock:
+            entry = self.index.get(url)
+            if entry is None:
+                return None
+            sha256 = entry['sha256']
+            # pinned before the file is checked, so it cannot be evicted in between
+            self.pinned.add(sha256)
+        path = self.object_path(sha256)
+        if file_sha256(path) != sha256:
+            logging.warning(f"Cached copy of {url} is missing or damaged, dropping it")
+            with self.lock:
+                if self.index.get(url, {}).get('sha256') == sha256:
+                    del self.index[url]
+            return None
+        with self.lock:
+            entry['last_access'] = time.time()
+        return SpooledPdf.from_path(path)
+
+    def store(self, url, pdf, etag=None, last_modified=None):
+        """Adds the downloaded pdf (a SpooledPdf) to the cache, moving its temporary file into the cache if it has one
+        """
+        sha256 = pdf.hexdigest()
+        path = self.object_path(sha256)
+        with self.lock:
+            # the pdf is read from the cache file from now on
+            self.pinned.add(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pdf.persist_to(path)
+
+        with self.lock:
+            self.index[url] = {
+                'sha256': sha256,
+                'size': pdf.size,
+                'etag': etag,
+                'last_modified': last_modified,
+                'last_access': time.time(),
+            }
+            self._evict()
+            self._save()
+
+    def size(self):
+        # objects shared by several urls are only counted once
+        return sum({entry['sha256']: entry['size'] for entry in self.index.values()}.values())
+
+    def evict(self):
+        with self.lock:
+            self._evict()
+
+    def _evict(self):
+        """Removes least recently used entries (other than the pinned ones) until the cache fits in max_bytes
+        """
+        total_size = self.size()
+        if total_size <= self.max_bytes:
+            return
+        for url, entry in sorted(self.index.items(), key=lambda item: item[1]['last_access']):
+            if total_size <= self.max_bytes:
+                break
+            if entry['sha256'] in self.pinned:
+                continue
+            del self.index[url]
+            if any(other['sha256'] == entry['sha256'] for other in self.index.values()):
+                continue
+            try:
+                os.remove(self.object_path(entry['sha256']))
+            except FileNotFoundError:
+                pass
+            total_size -= entry['size']
+            logging.info(f"Evicted {url} from the PDF cache")
+
+    async def fetch(self, url, http_client) -> SpooledPdf:
+        """
+        Returns the PDF at url, from the cache if the server confirms it has not changed, otherwise downloaded.
+        
+        Parameters:
+        - url: The PDF link.
+        - http_client: The run's HttpClient.
+        
+        Returns:
+        - The PDF as a SpooledPdf (to close once it is processed).
+        """
+        entry = self.index.get(url)
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        pdf = SpooledPdf()
+        try:
+            status, response_headers = await http_client.download(url, pdf, headers=headers)
+            if status == 304:
+                cached_pdf = await asyncio.to_thread(self.read, url)
+                if cached_pdf is not None:
+                    self.hits += 1
+                    pdf.close()
+                    return cached_pdf
+                # cached file went missing, download it unconditionally
+                status, response_headers = await http_client.download(url, pdf)
+        except BaseException:
+            pdf.close() # removes the temporary file of a failed download
+            raise
+
+        self.misses += 1
+        try:
+            await asyncio.to_thread(self.store, url, pdf, etag=response_headers.get('ETag'), last_modified=response_headers.get('Last-Modified'))
+        except BaseException:
+            pdf.close()
+            raise
+        return pdf
+
+    def close(self):
+        """Called once every pdf of the run is processed: the pinned entries can be evicted again"""
+        with self.lock:
+            self.pinned.clear()
+            self._evict()
+            self._save()
+        logging.info(f"PDF cache: {self.hits} served from cache, {self.misses} downloaded, {self.size() / 1e6:.1f} MB on disk")
+
+def get_pdf_cache():
+    """Returns the configured PdfCache, or None if the cache is disabled (pdf_cache_dir set to an empty value)
+    """
+    if not PDF_CACHE_DIR:
+        return None
+    return PdfCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
@@ -0,0 +1,119 @@
+# pdf_spool.py
+# Downloaded PDFs, spooled to disk above a memory threshold, so concurrent downloads of large bulletins do not
+# multiply the memory use of the small Functions / container instances.
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from src.configuration.configuration import PDF_SPOOL_MAX_MEMORY_BYTES, PDF_MAX_BYTES, PDF_SPOOL_DIR
+
+class PdfTooLargeError(Exception):
+    pass
+
+class SpooledPdf:
+    """
+    A PDF written in chunks (see HttpClient.download): kept in memory up to max_memory_bytes, moved to a temporary
+    file beyond that, and refused (PdfTooLargeError) beyond max_bytes.
+
+    source() is what the parsers get: the file path once the PDF is on disk, which every parser (and the process pool
+    worker) opens or memory maps itself instead of receiving a copy of the content, else the bytes.
+
+    Usage:
+        with SpooledPdf() as pdf:
+            await http_client.download(pdf_url, pdf)
+            extract_and_transform_pdf(pdf.source())
+    """
+
+    def __init__(self, max_memory_bytes=PDF_SPOOL_MAX_MEMORY_BYTES, max_bytes=PDF_MAX_BYTES, spool_dir=PDF_SPOOL_DIR):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_bytes = max_bytes
+        self.spool_dir = spool_dir
+        self.path = None
+        self.owns_file = True
+        self.buffer = None
+        self.file = None
+        self.reset()
+
+    @classmethod
+    def from_path(cls, path):
+        """A PDF that is already on disk (eg: in the pdf cache), the file is left in place on close"""
+        pdf = cls()
+        pdf.buffer = None
+        pdf.path = path
+        pdf.owns_file = False
+        pdf.size = os.path.getsize(path)
+        return pdf
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def check_size(self, size):
+        if self.max_bytes and size > self.max_bytes:
+            raise PdfTooLargeError(f"PDF is larger than the limit of {self.max_bytes / 1e6:.1f} MB")
+
+    def reset(self):
+        """Drops everything written so far (a retried download starts over)"""
+        self.close()
+        self.path = None
+        self.owns_file = True
+        self.buffer = io.BytesIO()
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        self.check_size(self.size)
+        self.sha256.update(chunk)
+        if self.file is None and self.path is None and self.size > self.max_memory_bytes:
+            self.roll_over()
+        (self.file or self.buffer).write(chunk)
+
+    def roll_over(self):
+        file_descriptor, self.path = tempfile.mkstemp(dir=self.spool_dir, suffix='.pdf')
+        self.file = os.fdopen(file_descriptor, 'wb')
+        self.file.write(self.buffer.getbuffer())
+        self.buffer = None
+
+    def finish(self):
+        """Called once the whole PDF is written, flushes the temporary file so the parsers can open it"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+    def source(self):
+        self.finish()
+        return self.path if self.path is not None else self.buffer.getvalue()
+
+    def persist_to(self, path):
+        """Stores the PDF at path (moved there if it is on disk already), which the PDF is read from afterwards"""
+        self.finish()
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(file_descriptor)
+        if self.path is None:
+            with open(temporary_path, 'wb') as f:
+                f.write(self.buffer.getbuffer())
+        elif self.owns_file:
+            shutil.move(self.path, temporary_path) # a rename when both are on the same file system
+        else:
+            shutil.copyfile(self.path, temporary_path)
+        os.replace(temporary_path, path)
+        self.path = path
+        self.owns_file = False
+        self.buffer = None
+
+    def close(self):
+        self.finish()
+        if self.path is not None and self.owns_file:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self.buffer = None
@@ -0,0 +1,96 @@
+# processed_pdf_tracker.py
+# Crash safe tracker of the pdf links that have already been processed.
+#
+# The tracker file (processed_pdfs.txt, newest link first, same as the Harti website) is only rewritten when the
+# journal is compacted. In between, every processed link is appended to the journal (processed_pdfs_journal.txt,
+# oldest link first) right after its pdf is committed, so a crash or Functions timeout only loses the pdfs that
+# were still in flight, and the next run resumes from the last checkpoint.
+import logging
+from src.configuration.configuration import TRACKER_CHECKPOINT_EVERY, TRACKER_COMPACT_EVERY
+from src.connector.blob import (download_processed_pdfs, upload_processed_pdfs, download_processed_pdfs_journal,
+                                append_processed_pdfs_journal, delete_processed_pdfs_journal)
+
+class ProcessedPdfTracker:
+    """
+    Processed pdf links, loaded once into an insertion ordered dict (oldest link first), which gives both the
+    fast membership test and the order of the tracker file.
+
+    Usage:
+        tracker = ProcessedPdfTracker().load()
+        if pdf_link not in tracker:
+            ...
+            tracker.add(pdf_link)   # checkpoints to the journal every checkpoint_every links
+        tracker.close()             # checkpoints the remaining links
+    """
+
+    def __init__(self, checkpoint_every=TRACKER_CHECKPOINT_EVERY, compact_every=TRACKER_COMPACT_EVERY):
+        self.checkpoint_every = max(checkpoint_every, 1)
+        self.compact_every = max(compact_every, 1)
+        self.links = {}
+        self.pending_links = []
+        self.journal_length = 0
+
+    def load(self):
+        """Loads the tracker file and the journal. Returns self
+        """
+        status_file_string = download_processed_pdfs()
+        journal_string = download_processed_pdfs_journal()
+
+        # the tracker file is newest first, the journal oldest first
+        for line in reversed(status_file_string.split('\n')):
+            self._add_loaded_link(line)
+        journal_lines = journal_string.split('\n')
+        for line in journal_lines:
+            self._add_loaded_link(line)
+        self.journal_length = sum(1 for line in journal_lines if line.strip())
+
+        logging.info(f"Loaded {len(self.links)} processed PDF links ({self.journal_length} from the journal)")
+        return self
+
+    def _add_loaded_link(self, line):
+        link = line.strip()
+        if link:
+            self.links[link] = None
+
+    def __contains__(self, pdf_link):
+        return pdf_link.strip() in self.links
+
+    def __len__(self):
+        return len(self.links)
+
+    def add(self, pdf_link):
+        """Marks pdf_link as processed, checkpointing to the journal every checkpoint_every links
+        """
+        pdf_link = pdf_link.strip()
+        if pdf_link in self.links:
+            return
+        self.links[pdf_link] = None
+        self.pending_links.append(pdf_link)
+        if len(self.pending_links) >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Appends the links added since the last checkpoint to the journal, compacting it when it has grown too long
+        """
+        if not self.pending_links:
+            return
+        append_processed_pdfs_journal(''.join(link + '\n' for link in self.pending_links))
+        self.journal_length += len(self.pending_links)
+        self.pending_links = []
+        logging.info(f"Processed PDF tracker checkpointed ({self.journal_length} links in the journal)")
+
+        if self.journal_length >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Rewrites the tracker file with every processed link (newest first) and drops the journal.
+        The tracker file is written before the journal is deleted, so a crash in between only leaves duplicates behind.
+        """
+        self.pending_links = []
+        upload_processed_pdfs('\n'.join(reversed(self.links)) + '\n')
+        delete_processed_pdfs_journal()
+        self.journal_length = 0
+        logging.info(f"Processed PDF tracker compacted ({len(self.links)} links)")
+
+    def close(self):
+        self.checkpoint()
@@ -0,0 +1,90 @@
+# sinks.py
+# Local outputs of the offline backfill (backfill.py). Every sink receives the transformed DataFrame of one bulletin.
+#
+# - csv:      monthly CSV files in a local directory, same layout as the blob storage files (see src/connector/csv_store.py)
+# - parquet:  partitioned Parquet dataset (needs pyarrow, see src/connector/parquet_store.py)
+# - emulator: Azurite (monthly CSV files) and the Cosmos DB emulator (price documents), through the same code as main.py
+import asyncio
+import logging
+import os
+from src.configuration.configuration import (BACKFILL_CSV_DIR, BACKFILL_PARQUET_DIR, EMULATOR_BLOB_CONNECTION_STRING,
+                                             EMULATOR_COSMOS_ENDPOINT, EMULATOR_COSMOS_KEY)
+from src.connector.csv_store import AzureBlobCsvStore, LocalCsvStore
+from src.connector.parquet_store import LocalParquetStore
+from src.pipeline2.data_format_converter import dataframe_to_csv_string, convert_dataframe_to_cosmos_format
+
+class BulletinSink:
+    """
+    Base class of the backfill outputs. write() is called in the parent process, once per bulletin.
+    """
+    name = None
+
+    def write(self, food_df):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class CsvSink(BulletinSink):
+    name = 'csv'
+
+    def __init__(self, directory=BACKFILL_CSV_DIR):
+        self.csv_store = LocalCsvStore(directory)
+
+    def write(self, food_df):
+        csv_data, actual_date_str = dataframe_to_csv_string(food_df)
+        self.csv_store.append(csv_data, actual_date_str)
+
+class ParquetSink(BulletinSink):
+    name = 'parquet'
+
+    def __init__(self, directory=BACKFILL_PARQUET_DIR):
+        self.parquet_store = LocalParquetStore(directory)
+
+    def write(self, food_df):
+        self.parquet_store.append(food_df)
+
+class EmulatorSink(BulletinSink):
+    """
+    Azurite and the Cosmos DB emulator. The emulator container / database names are the ones of the .env file.
+    """
+    name = 'emulator'
+
+    def __init__(self, blob_connection_string=EMULATOR_BLOB_CONNECTION_STRING, cosmos_endpoint=EMULATOR_COSMOS_ENDPOINT, cosmos_key=EMULATOR_COSMOS_KEY):
+        # imported here, so the file sinks work without the cosmos sdk
+        from src.connector.cosmos_db import CosmosConnection, write_harti_data_to_cosmosdb
+        self.write_harti_data_to_cosmosdb = write_harti_data_to_cosmosdb
+        self.csv_store = AzureBlobCsvStore(connection_string=blob_connection_string)
+        self.cosmos_connection = CosmosConnection(endpoint=cosmos_endpoint, key=cosmos_key)
+        # one event loop for the whole backfill, the cosmos connection is bound to it
+        self.loop = asyncio.new_event_loop()
+
+    def write(self, food_df):
+        csv_data, actual_date_str = dataframe_to_csv_string(food_df)
+        self.csv_store.append(csv_data, actual_date_str)
+        self.loop.run_until_complete(self.write_harti_data_to_cosmosdb(convert_dataframe_to_cosmos_format(food_df), self.cosmos_connection))
+
+    def close(self):
+        self.loop.run_until_complete(self.cosmos_connection.close())
+        self.loop.close()
+
+SINKS = {
+    CsvSink.name: CsvSink,
+    ParquetSink.name: ParquetSink,
+    EmulatorSink.name: EmulatorSink,
+}
+
+def get_sinks(names, output_dir=None):
+    """Returns the sinks with the given names, eg: ['csv', 'parquet']. The file sinks write to output_dir/<sink name>
+    if given, else to their configured directory.
+    """
+    sinks = []
+    for name in names:
+        if name not in SINKS:
+            raise ValueError(f"Unknown sink '{name}', expected one of {sorted(SINKS)}")
+        if output_dir and name in (CsvSink.name, ParquetSink.name):
+            sinks.append(SINKS[name](os.path.join(output_dir, name)))
+        else:
+            sinks.append(SINKS[name]())
+        logging.info(f"Backfill sink: {name}")
+    return sinks
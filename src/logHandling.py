@@ -1,19 +1,42 @@
+import collections
 import logging
+import logging.handlers
 import sys
+from src.configuration.configuration import LOG_BUFFER_MAX_RECORDS
 
 format_string = "[%(asctime)s: %(levelname)s: %(module)s: %(message)s]"
 
-log_messages = []
+# make custom logging.Handler inherited class to keep the log messages until they are shipped to blob storage
+# (see src/connector/log_shipping.py). The buffer is bounded, so memory stays flat however long the run is:
+# if the messages are not shipped in time, the oldest ones are dropped (and counted).
+class RingBufferHandler(logging.Handler):
 
-# make custom logging.Handler inherited class to store log messages in the log_messages list
-class ListHandler(logging.Handler):
+    def __init__(self, max_records):
+        super().__init__()
+        self.messages = collections.deque(maxlen=max_records)
+        self.dropped = 0
 
     def emit(self, record):
         log_entry = self.format(record)
-        log_messages.append(log_entry)
+        if len(self.messages) == self.messages.maxlen:
+            self.dropped += 1
+        self.messages.append(log_entry)
 
+    def drain(self):
+        """Returns (the buffered messages, the number of messages dropped since the last drain) and empties the buffer
+        """
+        self.acquire()
+        try:
+            messages = list(self.messages)
+            dropped = self.dropped
+            self.messages.clear()
+            self.dropped = 0
+        finally:
+            self.release()
+        return messages, dropped
 
-list_handler = ListHandler()
+
+log_buffer_handler = RingBufferHandler(LOG_BUFFER_MAX_RECORDS)
 
 
 logging.basicConfig(
@@ -22,7 +45,7 @@ logging.basicConfig(
 
     handlers=[
         logging.StreamHandler(sys.stdout),    # To send logs to terminal output
-        list_handler
+        log_buffer_handler
         # logging.FileHandler(log_filepath)
     ]
 )
@@ -31,3 +54,22 @@ logging.basicConfig(
 
 logging.getLogger('azure').setLevel('WARNING') # otherwise Azure info logs are too numerous
 
+
+
+# Worker processes (see main.py process pool) have their own copy of the log buffer, so their records are
+# sent back to the parent through a queue and handled there by the handlers configured above.
+def init_worker_logging(log_queue):
+    """Process pool initializer: routes every log record of the worker process into log_queue
+    """
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(logging.INFO)
+
+def start_worker_log_listener(log_queue) -> logging.handlers.QueueListener:
+    """Starts a listener that re-emits worker log records through the parent's handlers (terminal + log buffer)
+    """
+    listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers, respect_handler_level=True)
+    listener.start()
+    return listener
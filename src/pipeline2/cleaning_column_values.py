@@ -1,4 +1,23 @@
 import re
+import numpy as np
+import pandas as pd
+
+NUMERIC_CHARACTERS = '0123456789.-'
+# joins the cells of a column into one string, so the whole column is cleaned with a single str.translate call
+CELL_SEPARATOR = '\x1f'
+
+class KeepNumericCharacters(dict):
+    """
+    str.translate table that deletes every character except digits, decimal points, dashes and CELL_SEPARATOR.
+    Entries are added on first lookup, so any unicode character is handled.
+    """
+    def __missing__(self, code):
+        character = chr(code)
+        value = code if character in NUMERIC_CHARACTERS or character == CELL_SEPARATOR else None
+        self[code] = value
+        return value
+
+KEEP_NUMERIC_CHARACTERS = KeepNumericCharacters()
 
 def clean_values(value):
     """
@@ -12,6 +31,30 @@ def clean_values(value):
     """
     return re.sub(r'[^0-9.-]', '', str(value))
 
+def clean_column(column):
+    """
+    Vectorized clean_values for a whole column: same result as column.apply(clean_values), except that
+    missing values stay NaN instead of becoming ''.
+    
+    Parameters:
+    - column: The Series to clean.
+    
+    Returns:
+    - The cleaned Series (object dtype).
+    """
+    values = column.to_numpy(dtype=object)
+    cells = [str(value) for value in values]
+    cleaned = CELL_SEPARATOR.join(cells).translate(KEEP_NUMERIC_CHARACTERS).split(CELL_SEPARATOR)
+    if len(cleaned) != len(cells):
+        # a cell contained the separator itself, clean cell by cell instead
+        cleaned = [cell.translate(KEEP_NUMERIC_CHARACTERS).replace(CELL_SEPARATOR, '') for cell in cells]
+    cleaned = np.array(cleaned, dtype=object)
+
+    missing = pd.isna(values)
+    if missing.any():
+        cleaned[missing] = np.nan
+    return pd.Series(cleaned, index=column.index, copy=False)
+
 def apply_cleaning_to_dataframe(df, start_row=1):
     """
     Applies the cleaning function to all columns except the first one, starting from a specific row.
@@ -24,7 +67,7 @@ def apply_cleaning_to_dataframe(df, start_row=1):
     - The cleaned DataFrame.
     """
     for column in df.columns[1:]:
-        df.loc[start_row:, column] = df.loc[start_row:, column].apply(clean_values)
+        df.loc[start_row:, column] = clean_column(df.loc[start_row:, column])
     
     return df
 
@@ -1,7 +1,20 @@
 # csv_data.py
+import hashlib
 import uuid
 import pandas as pd
 from io import StringIO
+from src.configuration.configuration import COSMOS_DOCUMENT_ID_MODE
+
+# namespace of the deterministic document ids, never change it: existing documents would no longer be overwritten
+COSMOS_DOCUMENT_ID_NAMESPACE = uuid.UUID('cd6cc77d-3179-5319-a810-137dd3da2bc5')
+# fields identifying a price (one item at one market on one day, on one bulletin page)
+COSMOS_DOCUMENT_KEY_FIELDS = ["date", "location", "item_names", "page"]
+COSMOS_DOCUMENT_CONTENT_FIELDS = COSMOS_DOCUMENT_KEY_FIELDS + ["value", "min_value", "max_value"]
+
+def bulletin_date_string(df):
+    # Extract the date from the first row of the Date column and convert it to the required format (YYYY-MM-DD)
+    first_row_date = pd.to_datetime(df['Date'].iloc[0], dayfirst=True)
+    return first_row_date.strftime('%Y-%m-%d')
 
 def dataframe_to_csv_string(df):
     # Convert the DataFrame to a StringIO object
@@ -9,40 +22,84 @@ def dataframe_to_csv_string(df):
     df.to_csv(output, index=False)
     output.seek(0)  # Rewind the StringIO object to start reading from the beginning
 
-    # Extract the date from the first row of the Date column and convert it to the required format
-    first_row_date = pd.to_datetime(df['Date'].iloc[0], dayfirst=True)
-    formatted_date = first_row_date.strftime('%Y-%m-%d')
+    formatted_date = bulletin_date_string(df)
 
     # Return the StringIO object and the formatted date
     stringio_data = output.getvalue()
     
     return stringio_data, formatted_date
     
-def convert_dataframe_to_cosmos_format(df):
+COSMOS_DOCUMENT_COLUMNS = {
+    "date": 'Date',
+    "database_write_date": 'Database Write Date',
+    "location": 'Location',
+    "page": 'Page',
+    "item_names": 'Item_Names',
+    "value": 'Value',
+    "min_value": 'Min_Value',
+    "max_value": 'Max_Value',
+}
+
+def column_to_document_values(column):
+    """
+    Converts a DataFrame column once into a list of JSON friendly python values:
+    timestamps to ISO strings, numpy numbers to python numbers.
+    """
+    if pd.api.types.is_datetime64_dtype(column) and not (column.dt.microsecond.any() or column.dt.nanosecond.any()):
+        return column.dt.strftime('%Y-%m-%dT%H:%M:%S').tolist()
+    return [value.isoformat() if isinstance(value, pd.Timestamp) else value for value in column.tolist()]
+
+def cosmos_document_id(document, id_mode=COSMOS_DOCUMENT_ID_MODE):
+    """
+    Returns the id of a Cosmos DB document.
+    
+    Parameters:
+    - document: The document dict (without id).
+    - id_mode: 'key' (uuid5 of Date, Location, Item_Names, Page), 'content' (sha256 of the key and the prices) or 'random' (uuid4).
+    
+    Returns:
+    - The id string.
+    """
+    if id_mode == 'key':
+        return str(uuid.uuid5(COSMOS_DOCUMENT_ID_NAMESPACE, '|'.join(str(document[field]) for field in COSMOS_DOCUMENT_KEY_FIELDS)))
+    if id_mode == 'content':
+        return hashlib.sha256('|'.join(str(document[field]) for field in COSMOS_DOCUMENT_CONTENT_FIELDS).encode('utf-8')).hexdigest()
+    if id_mode == 'random':
+        return str(uuid.uuid4())
+    raise ValueError(f"Unknown cosmos document id mode '{id_mode}', expected 'key', 'content' or 'random'")
 
-    cosmos_db_hartidata = []
+def convert_dataframe_to_cosmos_format(df, chunk_size=1000, id_mode=COSMOS_DOCUMENT_ID_MODE):
+    """
+    Converts the transformed DataFrame into Cosmos DB documents.
+    
+    The columns are converted once per chunk of chunk_size rows and the documents are yielded lazily,
+    so a writer can consume them as they are built without a second full copy of the data in memory.
     
+    Parameters:
+    - df: The transformed DataFrame.
+    - chunk_size: Number of rows converted at a time.
+    - id_mode: How document ids are derived, see cosmos_document_id.
+    
+    Returns:
+    - A generator of document dicts.
+    """
     required_columns = ['Database Write Date', 'Date', 'Location','Page', 'Item_Names', 'Value', 'Min_Value', 'Max_Value']
     
-    # Check if all required columns are present
+    # Check if all required columns are present (before the first document is requested)
     if not all(col in df.columns for col in required_columns):
         raise KeyError(f"One or more required columns are missing: {required_columns}")
     
-    for _, row in df.iterrows():
-  
-        rate_document = {
-             
-            "id": str(uuid.uuid4()),
-            "date": row['Date'].isoformat() if isinstance(row['Date'], pd.Timestamp) else row['Date'],
-            "database_write_date": row['Database Write Date'].isoformat() if isinstance(row['Database Write Date'], pd.Timestamp) else row['Database Write Date'],
-            "location": row['Location'],
-            "page": row['Page'],
-            "item_names": row['Item_Names'],
-            "value": row['Value'],
-            "min_value": row['Min_Value'],
-            "max_value": row['Max_Value'],
-        }
-
-        cosmos_db_hartidata.append(rate_document)
-        
-    return cosmos_db_hartidata
\ No newline at end of file
+    cosmos_document_id({field: None for field in COSMOS_DOCUMENT_CONTENT_FIELDS}, id_mode) # fail early on an unknown id mode
+    
+    return generate_cosmos_documents(df, chunk_size, id_mode)
+
+def generate_cosmos_documents(df, chunk_size=1000, id_mode=COSMOS_DOCUMENT_ID_MODE):
+    fields = list(COSMOS_DOCUMENT_COLUMNS)
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        columns = [column_to_document_values(chunk[COSMOS_DOCUMENT_COLUMNS[field]]) for field in fields]
+        for values in zip(*columns):
+            rate_document = {"id": None}
+            rate_document.update(zip(fields, values))
+            rate_document["id"] = cosmos_document_id(rate_document, id_mode)
+            yield rate_document
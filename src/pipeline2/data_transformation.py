@@ -1,8 +1,30 @@
-import re
 import pandas as pd
 from datetime import datetime
+import logging
 import numpy as np
 
+# Date header formats of the price tables, in the order they are tried
+DATE_FORMAT_GROUPS = {
+    'day_first_slash': '%d/%m/%Y',
+    'year_first_slash': '%Y/%m/%d',
+    'year_first_dash': '%Y-%m-%d',
+    'day_first_dash': '%d-%m-%Y',
+}
+DATE_FORMATS = list(DATE_FORMAT_GROUPS.values())
+# a date header, optionally with the '.1', '.2' .. suffix of repeated headers; the named group tells its format
+DATE_HEADER_PATTERN = (r'^\s*(?P<date>(?P<day_first_slash>\d{1,2}/\d{1,2}/\d{4})|(?P<year_first_slash>\d{4}/\d{1,2}/\d{1,2})'
+                       r'|(?P<year_first_dash>\d{4}-\d{1,2}-\d{1,2})|(?P<day_first_dash>\d{1,2}-\d{1,2}-\d{4}))(?:\.\d+)?\s*$')
+# format of the last converted table, tried first on the next one
+last_date_format = None
+
+# A price cell written without its '-' (a fused range): 5 digits as 2+3 (90120 -> 90-120), 6 as 3+3 (350400), 7 as 3+4
+# (9001000). The max part does not start with 0, and the split is only taken if it gives min <= max; any other
+# number (eg: 10000, 12050, 400350) is a single price.
+FUSED_RANGE_PATTERN = r'^(?:(\d{2})([1-9]\d{2})|(\d{3})([1-9]\d{2,3}))$'
+# Any other price cell: a single price or a min-max range (groups 0-1), or a range missing one side, '350-' or '-350'
+# (groups 2-3, the missing min or max is left at 0, as the former split on '-' did)
+PRICE_RANGE_PATTERN = r'^(?:(\d+(?:\.\d*)?)(?:-(\d+(?:\.\d*)?))?|(\d+(?:\.\d*)?)-|-(\d+(?:\.\d*)?))$'
+
 def rename_columns_before_dot(df):
     """
     Renames columns in the DataFrame by extracting the part before the first dot.
@@ -59,15 +81,63 @@ def preprocess_dataframe(df):
     
     return df_transposed
     
+def detect_date_format(dates, sample_size=3):
+    """
+    Picks the date format of a column of date headers from a small sample, trying the format of the previous
+    bulletin first (consecutive bulletins almost always share one).
+    
+    Parameters:
+    - dates: Series of date strings (with the '.1' header suffixes already removed).
+    - sample_size: Number of headers that must parse with the format.
+    
+    Returns:
+    - The strptime format, or None if no known format fits the sample.
+    """
+    sample = dates.dropna().head(sample_size)
+    candidates = [last_date_format] + [date_format for date_format in DATE_FORMATS if date_format != last_date_format]
+    for date_format in candidates:
+        if date_format is not None and pd.to_datetime(sample, format=date_format, errors='coerce').notna().all():
+            return date_format
+    return None
+
 def convert_dates(df_transposed):
+    """
+    Converts the 'Date' column (the date headers of the price table) to datetimes.
+    
+    The format is detected once from a sample of the headers and the whole column is parsed with it in one call.
+    Headers in another format (mixed tables) are grouped by format and every group is parsed in one call.
+    
+    Parameters:
+    - df_transposed: The DataFrame with the 'Date' column.
+    
+    Returns:
+    - The DataFrame with a datetime 'Date' column.
+    """
+    global last_date_format
 
-    df_transposed['Date'] = df_transposed['Date'].str.replace(r'\.\d+$', '', regex=True)
-    try: df_transposed['Date'] = pd.to_datetime(df_transposed['Date'], format='%d/%m/%Y', errors='raise')
-    except ValueError: 
-        try: df_transposed['Date'] = pd.to_datetime(df_transposed['Date'], format='%Y/%m/%d', errors='raise')
-        except ValueError:
-            try: df_transposed['Date'] = pd.to_datetime(df_transposed['Date'], format='%Y-%m-%d', errors='raise')
-            except ValueError: df_transposed['Date'] = pd.to_datetime(df_transposed['Date'], format='%d-%m-%Y', errors='raise')
+    # one pass: strip the '.1' suffixes of repeated headers and classify every header by its format
+    headers = df_transposed['Date'].astype(str).str.extract(DATE_HEADER_PATTERN)
+    dates = headers['date']
+
+    date_format = detect_date_format(dates)
+    if date_format is not None:
+        converted = pd.to_datetime(dates, format=date_format, errors='coerce')
+        last_date_format = date_format
+    else:
+        converted = pd.Series(pd.NaT, index=dates.index, dtype='datetime64[ns]')
+
+    unparsed = converted.isna()
+    if unparsed.any():
+        # mixed formats: parse the remaining headers one format group at a time
+        for group, date_format in DATE_FORMAT_GROUPS.items():
+            in_group = unparsed & headers[group].notna()
+            if in_group.any():
+                converted[in_group] = pd.to_datetime(dates[in_group], format=date_format, errors='coerce')
+        unparsed = converted.isna()
+        if unparsed.any():
+            raise ValueError(f"Date headers in an unknown format: {df_transposed.loc[unparsed, 'Date'].unique()[:5].tolist()}")
+
+    df_transposed['Date'] = converted
 
     # # Define a list of date formats to try
     # date_formats = [
@@ -114,14 +184,7 @@ def transform_food_df(df_transposed):
     # Replace "-" with NaN in the 'Value' column
     df_melted['Value'] = df_melted['Value'].replace("-", float("NaN"))
 
-    # Define a function to format 6-digit numbers
-    def format_six_digit_number(value):
-        if isinstance(value, str) and re.fullmatch(r"\d{6}", value):
-            return value[:3] + "-" + value[3:]
-        return value
-
-    # Apply the function to format 6-digit numbers in the 'Value' column
-    df_melted['Value'] = df_melted['Value'].apply(format_six_digit_number)
+    # 6-digit fused ranges (eg: 350400) are split into 350-400 by split_and_convert_value_column
 
     return df_melted
 
@@ -143,6 +206,38 @@ def update_item_names(df):
     
     return df
 
+def parse_price_ranges(values):
+    """
+    Parses cleaned price cells into integer min / max prices in one vectorized pass.
+    
+    Parameters:
+    - values: Series of price cells, eg: '350-400', '350400' / '90120' (fused ranges), '420' (single price), '50.00-60.00',
+      '350-' (range without max).
+    
+    Returns:
+    - min_values: int32 array (0 where the cell is not a valid price, or has no min).
+    - max_values: int32 array (0 where the cell is not a valid price, or has no max; the min price for single prices).
+    - valid: bool array, True where the cell is a valid price or price range.
+    - formatted: the cells as strings, with fused ranges written as min-max.
+    """
+    text = values.astype(str)
+    fused_parts = text.str.extract(FUSED_RANGE_PATTERN)
+    fused_low = fused_parts[0].fillna(fused_parts[2])
+    fused_high = fused_parts[1].fillna(fused_parts[3])
+    fused = (pd.to_numeric(fused_low) <= pd.to_numeric(fused_high)).to_numpy()
+
+    parts = text.str.extract(PRICE_RANGE_PATTERN)
+    low = parts[0].fillna(parts[2]).mask(fused, fused_low)
+    # a single price is its own max
+    high = parts[1].fillna(parts[3]).fillna(parts[0]).mask(fused, fused_high)
+    valid = (low.notna() | high.notna()).to_numpy()
+
+    min_values = pd.to_numeric(low).fillna(0).to_numpy().astype(np.int32)
+    max_values = pd.to_numeric(high).fillna(0).to_numpy().astype(np.int32)
+    formatted = text.mask(fused, fused_low + '-' + fused_high)
+
+    return min_values, max_values, valid, formatted
+
 def split_and_convert_value_column(df):
     """
     Splits the 'Value' column into 'Min_Value' and 'Max_Value' columns and converts them to integers.
@@ -153,24 +248,16 @@ def split_and_convert_value_column(df):
     Returns:
     - The DataFrame with 'Min_Value' and 'Max_Value' columns.
     """
-    # Ensure all values in 'Value' are strings
-    df['Value'] = df['Value'].astype(str)
-    
-    # Split the 'Value' column into 'Min_Value' and 'Max_Value' columns
-    split_values = df['Value'].str.split('-', expand=True)
-    
-    # Ensure the split operation results in exactly two columns
-    if split_values.shape[1] == 2:
-        df[['Min_Value', 'Max_Value']] = split_values
-    else:
-        # Handle cases where the split does not result in exactly two columns
-        # For example, you might want to log an error or handle it differently
-        print("Warning: Split did not result in exactly two columns")
-        df[['Min_Value', 'Max_Value']] = pd.DataFrame([['0', '0']], index=df.index, columns=['Min_Value', 'Max_Value'])
-    
-    # Convert the new columns to integers, handling potential conversion errors
-    df['Min_Value'] = pd.to_numeric(df['Min_Value'], errors='coerce').fillna(0).astype(int)
-    df['Max_Value'] = pd.to_numeric(df['Max_Value'], errors='coerce').fillna(0).astype(int)
+    min_values, max_values, valid, formatted = parse_price_ranges(df['Value'])
+
+    df['Value'] = formatted
+    df['Min_Value'] = min_values
+    df['Max_Value'] = max_values
+
+    # missing prices are dropped later on, anything else that is not a price is reported
+    invalid = ~valid & df['Value'].ne('nan').to_numpy()
+    if invalid.any():
+        logging.warning(f"{invalid.sum()} values are not a price or a price range, their Min_Value / Max_Value are set to 0: {df.loc[invalid, 'Value'].unique()[:10].tolist()}")
     
     return df
 
@@ -207,8 +294,17 @@ def drop_rows_with_missing_values_in_value_column(df):
 
     return df
 
-def add_page_number_column(df):
+def add_page_number_column(df, page_number=None):
+    """
+    Adds the 'Page' column, the bulletin page every row was extracted from, as the last column.
+    
+    Parameters:
+    - df: The DataFrame to add the column to.
+    - page_number: The page of all rows, or None to move the 'Page' column the rows were already tagged with to the end.
     
-    df["Page"] =   2
+    Returns:
+    - The DataFrame with the 'Page' column.
+    """
+    df["Page"] = df.pop("Page") if page_number is None else page_number
 
     return df
\ No newline at end of file
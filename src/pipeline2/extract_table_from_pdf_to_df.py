@@ -1,31 +1,368 @@
-import tabula
+import logging
+import os
+import time
+from collections import defaultdict
+import numpy as np
 import pandas as pd
+import io
+import tabula
+from tabula.backend import TabulaVm
+from pdfplumber.utils import extract_text
+from src.configuration.configuration import TABLE_EXTRACTION_ENGINE
+from src.pipeline2.get_pdfdata import BulletinPdf
+
+try:
+    import jpype
+except ImportError: # tabula-py then runs tabula-java as a subprocess
+    jpype = None
+
+def parse_pages(pages):
+    """Returns the list of 1-based page numbers of pages given as an int, an iterable of ints or a tabula page string (eg: '1,3-4')
+    """
+    if isinstance(pages, int):
+        return [pages]
+    if not isinstance(pages, str):
+        return [int(page) for page in pages]
+    page_numbers = []
+    for part in pages.split(','):
+        first, _, last = part.strip().partition('-')
+        page_numbers += list(range(int(first), int(last or first) + 1))
+    return page_numbers
+
+class TabulaBatchExtractor:
+    """
+    Runs tabula table extraction against one warm JVM for the whole run.
+    
+    With the jpype backend tabula-py starts the JVM on the first `read_pdf` call of the process; here it is
+    started explicitly (once) so that the JVM startup time and the per-document extraction times can be
+    reported separately. Many PDFs / pages can be extracted in one `extract_many` call.
+    """
+
+    def __init__(self, lattice=True):
+        self.lattice = lattice
+        self.tabula_vm = None
+        self.jvm_startup_seconds = None
+        self.document_seconds = []
 
-def extract_tables_from_pdf_to_df_page_1(pdf_bytes_io):
+    def start(self):
+        """Starts the JVM used by tabula if it is not running yet. Returns the startup time in seconds.
+        """
+        if self.jvm_startup_seconds is not None:
+            return self.jvm_startup_seconds
+
+        start_time = time.perf_counter()
+        # the JVM is process wide: tabula-py's own read_pdf calls reuse it
+        self.tabula_vm = TabulaVm(java_options=['-Djava.awt.headless=true', '-Dfile.encoding=UTF8'], silent=None)
+        if self.tabula_vm.tabula is None:
+            # jpype is not available: tabula-py falls back to one java subprocess per read_pdf call
+            logging.warning("jpype is not available, tabula will start a new JVM for every PDF")
+        self.jvm_startup_seconds = time.perf_counter() - start_time
+        logging.info(f"tabula JVM started in {self.jvm_startup_seconds:.2f}s")
+        return self.jvm_startup_seconds
+
+    def extract(self, pdf_source, pages='1'):
+        """
+        Extracts the tables on the given pages of a PDF and combines them into a single DataFrame.
         
-        # Pass the BytesIO object to tabula.read_pdf
-        tables = tabula.read_pdf(pdf_bytes_io,pages='1',lattice=True)
+        Parameters:
+        - pdf_source: A file path, raw bytes or a file-like object of the PDF.
+        - pages: The pages to read (eg: 2, [1, 2], '1-2').
         
+        Returns:
+        - The combined DataFrame.
+        """
+        tables_by_page = self.extract_pages(pdf_source, pages)
+
         # Combine all tables into a single DataFrame if there are multiple tables
-        if isinstance(tables, list):
-            combined_df = pd.concat(tables, ignore_index=True)
+        return pd.concat([table for tables in tables_by_page.values() for table in tables], ignore_index=True)
+
+    def extract_pages(self, pdf_source, pages='1'):
+        """
+        Extracts the tables on the given pages of a PDF, loading the PDF only once.
+        
+        Parameters:
+        - pdf_source: A file path, raw bytes or a file-like object of the PDF.
+        - pages: The pages to read (eg: 2, [1, 2], '1-2').
+        
+        Returns:
+        - A dict of page number -> list of the DataFrames of the tables on that page, in page order.
+        """
+        self.start()
+        page_numbers = parse_pages(pages)
+
+        start_time = time.perf_counter()
+        if self.lattice and jpype is not None and self.tabula_vm.tabula is not None:
+            tables_by_page = self.extract_pages_in_jvm(pdf_source, page_numbers)
         else:
-            combined_df = tables
+            # no jpype (or stream mode): one tabula-java call per page. guess only changes stream mode tables, it is
+            # turned off so that both paths run the same lattice extraction
+            if isinstance(pdf_source, bytes):
+                pdf_source = io.BytesIO(pdf_source)
+            tables_by_page = {}
+            for page_number in page_numbers:
+                if hasattr(pdf_source, 'seek'):
+                    pdf_source.seek(0)
+                tables_by_page[page_number] = tabula.read_pdf(pdf_source, pages=str(page_number), lattice=self.lattice, guess=not self.lattice)
+        self.document_seconds.append(time.perf_counter() - start_time)
+        logging.info(f"tabula extracted page(s) {', '.join(map(str, page_numbers))} in {self.document_seconds[-1]:.2f}s")
+
+        return tables_by_page
 
-        # print(tabulate(combined_df, headers='keys', tablefmt='psql'))
-        return combined_df
+    def extract_pages_in_jvm(self, pdf_source, page_numbers):
+        # Same as tabula.read_pdf(lattice=True): tabula-java's lattice extraction (SpreadsheetExtractionAlgorithm on
+        # the whole page; tabula-java 1.0.5 only uses --guess, the NurminenDetectionAlgorithm table areas, in stream
+        # mode), but the document is loaded once for all pages, straight from memory (tabula-py writes in-memory PDFs
+        # to a temporary file), and every table keeps the page it came from.
+        PDDocument = jpype.JClass('org.apache.pdfbox.pdmodel.PDDocument')
+        ObjectExtractor = jpype.JClass('technology.tabula.ObjectExtractor')
+        SpreadsheetExtractionAlgorithm = jpype.JClass('technology.tabula.extractors.SpreadsheetExtractionAlgorithm')
+
+        if isinstance(pdf_source, (str, os.PathLike)):
+            document = PDDocument.load(jpype.JClass('java.io.File')(os.fspath(pdf_source)))
+        else:
+            content = pdf_source if isinstance(pdf_source, bytes) else pdf_source.getvalue() if isinstance(pdf_source, io.BytesIO) else pdf_source.read()
+            document = PDDocument.load(jpype.JArray(jpype.JByte)(content))
+        try:
+            object_extractor = ObjectExtractor(document)
+            algorithm = SpreadsheetExtractionAlgorithm()
+            tables_by_page = {}
+            for page_number in page_numbers:
+                page = object_extractor.extract(page_number)
+                tables_by_page[page_number] = []
+                for table in algorithm.extract(page):
+                    # cells as tabula-py reads tabula-java's JSON output: empty text is NaN, the first row is the header
+                    rows = [[str(cell.getText()) or np.nan for cell in row] for row in table.getRows()]
+                    if rows:
+                        tables_by_page[page_number].append(PdfplumberLatticeEngine.rows_to_dataframe(rows))
+            return tables_by_page
+        finally:
+            document.close()
 
-def extract_tables_from_pdf_to_df_page_2(pdf_bytes_io):
+    def extract_many(self, pdf_sources_and_pages):
+        """
+        Extracts tables from many PDFs with the same warm JVM.
         
-        # Pass the BytesIO object to tabula.read_pdf
-        tables = tabula.read_pdf(pdf_bytes_io,pages='2',lattice=True)
+        Parameters:
+        - pdf_sources_and_pages: An iterable of (pdf_source, pages) tuples.
         
-        # Combine all tables into a single DataFrame if there are multiple tables
-        if isinstance(tables, list):
-            combined_df = pd.concat(tables, ignore_index=True)
-        else:
-            combined_df = tables
+        Returns:
+        - A list with one combined DataFrame per PDF, in the same order.
+        """
+        combined_dfs = [self.extract(pdf_source, pages) for pdf_source, pages in pdf_sources_and_pages]
+        self.log_report()
+        return combined_dfs
+
+    def report(self):
+        total_seconds = sum(self.document_seconds)
+        return {
+            'jvm_startup_seconds': self.jvm_startup_seconds,
+            'documents': len(self.document_seconds),
+            'extraction_seconds_total': total_seconds,
+            'extraction_seconds_mean': total_seconds / len(self.document_seconds) if self.document_seconds else None,
+        }
+
+    def log_report(self):
+        report = self.report()
+        if report['documents']:
+            logging.info(f"tabula: JVM startup {report['jvm_startup_seconds']:.2f}s, {report['documents']} document(s) extracted in "
+                         f"{report['extraction_seconds_total']:.2f}s ({report['extraction_seconds_mean']:.2f}s per document)")
+
+# One extractor (and so one JVM) per process
+tabula_extractor = TabulaBatchExtractor(lattice=True)
+
+def extract_tables_batch(pdf_sources_and_pages):
+    """Extracts tables from many (pdf_source, pages) pairs in one call, see TabulaBatchExtractor.extract_many
+    """
+    return tabula_extractor.extract_many(pdf_sources_and_pages)
+
+
+def is_blank_header(df):
+    return len(df.columns) > 0 and all(str(column).startswith('Unnamed: ') for column in df.columns)
+
+def drop_blank_header(df):
+    """
+    Some bulletins (eg: daily_27-01-2024.pdf) draw a blank ruled row above the table header, which both engines
+    would take as the header row: every column becomes 'Unnamed: i' and the real 'Variety' / date header ends up in
+    the first data row. The header is then taken from the first row that is not empty.
+
+    Parameters:
+    - df: A table as read by an engine.
+
+    Returns:
+    - The table with the first non empty row as its header (unchanged if the header row is not blank).
+    """
+    if not is_blank_header(df):
+        return df
+    rows = df.astype(object).where(df.notna(), np.nan).values.tolist()
+    rows = drop_leading_empty_rows(rows)
+    if len(rows) < 2:
+        return df
+    return PdfplumberLatticeEngine.rows_to_dataframe(rows)
+
+def drop_leading_empty_rows(rows):
+    for index, row in enumerate(rows):
+        if not all(pd.isna(value) for value in row):
+            return rows[index:]
+    return []
+
+class TableExtractionEngine:
+    """
+    Interface of the table extraction engines. `extract` reads the ruled (lattice) tables on the given
+    pages of a PDF and returns them combined into one DataFrame, with the first non empty table row as the header.
+    """
+    name = None
+
+    def start(self):
+        """Optional warm up, called once per process
+        """
+        pass
+
+    def extract_pages(self, pdf, pages):
+        """
+        Reads the tables of several pages with a single parse of the PDF.
+        
+        Parameters:
+        - pdf: A BulletinPdf, or a file path / file-like object of the PDF.
+        - pages: The 1-based page number(s) to read (int, list of ints or tabula page string).
+        
+        Returns:
+        - A dict of page number -> the page's tables combined into one DataFrame (pages without tables are left out).
+        """
+        raise NotImplementedError
+
+    def extract(self, pdf, pages):
+        """
+        Parameters:
+        - pdf: A BulletinPdf, or a file path / file-like object of the PDF.
+        - pages: The 1-based page number(s) to read.
+        
+        Returns:
+        - The tables of all pages combined into one DataFrame.
+        """
+        tables = list(self.extract_pages(pdf, pages).values())
+        if not tables:
+            return pd.DataFrame()
+        return pd.concat(tables, ignore_index=True)
+
+class TabulaEngine(TableExtractionEngine):
+    """tabula-java lattice mode (needs a JVM)
+    """
+    name = 'tabula'
+
+    def start(self):
+        tabula_extractor.start()
+
+    def extract_pages(self, pdf, pages):
+        if isinstance(pdf, BulletinPdf):
+            pdf = pdf.path if pdf.path is not None else pdf.content
+        tables_by_page = tabula_extractor.extract_pages(pdf, pages)
+        return {page_number: pd.concat([drop_blank_header(table) for table in tables], ignore_index=True)
+                for page_number, tables in tables_by_page.items() if tables}
+
+class PdfplumberLatticeEngine(TableExtractionEngine):
+    """
+    Pure python lattice table extraction built on pdfplumber's ruling line table finder.
+    
+    The output follows tabula's lattice DataFrames: cell lines are joined with '\\r', empty cells are NaN,
+    the first non empty row becomes the header (blank names as 'Unnamed: i', duplicates suffixed '.1', '.2', ...)
+    and numeric columns are converted. A character belongs to a cell only if it lies inside the cell's
+    rulings (like tabula, text overflowing into the next cell is dropped instead of being split).
+    When given a BulletinPdf the already parsed page is reused, so the PDF is not parsed again.
+    """
+    name = 'pdfplumber'
+
+    # join the short ruling segments some bulletins draw around overflowing text
+    table_settings = {'vertical_strategy': 'lines', 'horizontal_strategy': 'lines', 'join_x_tolerance': 6}
+    # characters may start slightly left of a cell's left ruling (left aligned text sits right on it)
+    left_tolerance = 0.1
+
+    def extract_pages(self, pdf, pages):
+        if not isinstance(pdf, BulletinPdf):
+            with BulletinPdf(pdf) as bulletin_pdf:
+                return self.extract_pages(bulletin_pdf, pages)
+
+        tables_by_page = {}
+        for page_number in parse_pages(pages):
+            tables = self.extract_page_tables(pdf.pdf.pages[page_number - 1])
+            if tables:
+                tables_by_page[page_number] = pd.concat(tables, ignore_index=True)
+        return tables_by_page
+
+    def extract_page_tables(self, page):
+        chars = page.chars
+        if not chars:
+            return []
+        x0 = np.array([char['x0'] for char in chars])
+        x1 = np.array([char['x1'] for char in chars])
+        top = np.array([char['top'] for char in chars])
+        bottom = np.array([char['bottom'] for char in chars])
+
+        tables = []
+        for table in page.find_tables(self.table_settings):
+            rows = []
+            for row in table.rows:
+                row_values = []
+                for cell in row.cells:
+                    # cells covered by a merged cell are None in pdfplumber
+                    if cell is None:
+                        row_values.append(np.nan)
+                        continue
+                    in_cell = (x0 >= cell[0] - self.left_tolerance) & (x1 <= cell[2]) & (top >= cell[1]) & (bottom <= cell[3])
+                    cell_chars = [chars[i] for i in np.flatnonzero(in_cell)]
+                    cell_text = extract_text(cell_chars, keep_blank_chars=True).strip().replace('\n', '\r') if cell_chars else ''
+                    row_values.append(cell_text if cell_text else np.nan)
+                rows.append(row_values)
+            # a blank ruled row above the header is not the header (see drop_blank_header)
+            rows = drop_leading_empty_rows(rows)
+            if len(rows) > 1:
+                tables.append(self.rows_to_dataframe(rows))
+        return tables
+
+    @staticmethod
+    def rows_to_dataframe(rows):
+        # header handling is the same as tabula-py's (tabula.io._extract_from)
+        columns = list(rows[0])
+        unnamed_index = 0
+        for index, column in enumerate(columns):
+            if pd.isna(column):
+                columns[index] = f"Unnamed: {unnamed_index}"
+                unnamed_index += 1
+
+        counts = defaultdict(int)
+        for index, column in enumerate(columns):
+            count = counts[column]
+            while count > 0:
+                counts[column] = count + 1
+                column = f"{column}.{count}"
+                count = counts[column]
+            columns[index] = column
+            counts[column] = count + 1
+
+        df = pd.DataFrame(rows[1:], columns=columns)
+        for column in df.columns:
+            try:
+                df[column] = pd.to_numeric(df[column], errors='raise')
+            except (ValueError, TypeError):
+                pass
+        return df
+
+TABLE_EXTRACTION_ENGINES = {
+    TabulaEngine.name: TabulaEngine,
+    PdfplumberLatticeEngine.name: PdfplumberLatticeEngine,
+}
+
+def get_table_extraction_engine(name=None) -> TableExtractionEngine:
+    """Returns the table extraction engine with the given name (default: TABLE_EXTRACTION_ENGINE from configuration)
+    """
+    name = name or TABLE_EXTRACTION_ENGINE
+    if name not in TABLE_EXTRACTION_ENGINES:
+        raise ValueError(f"Unknown table extraction engine '{name}', expected one of {list(TABLE_EXTRACTION_ENGINES)}")
+    return TABLE_EXTRACTION_ENGINES[name]()
+
+table_extraction_engine = get_table_extraction_engine()
 
-        # print(tabulate(combined_df, headers='keys', tablefmt='psql'))
-        return combined_df
+def extract_tables_by_page(pdf, pages, engine=None):
+    """Reads the tables of the given pages in a single pass, see TableExtractionEngine.extract_pages
+    """
+    return (engine or table_extraction_engine).extract_pages(pdf, pages)
     
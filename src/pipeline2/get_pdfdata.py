@@ -1,14 +1,19 @@
 import io
-import requests
+import mmap
+import os
+import asyncio
+import aiohttp
+import re
 import pdfplumber
+from PyPDF2 import PdfReader
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
+from src.connector.pdf_spool import SpooledPdf, PdfTooLargeError
 
-def get_latest_pdf_link(pdf_source): 
+async def get_latest_pdf_link(pdf_source, http_client): 
     try:
-        response = requests.get(pdf_source)
-        response.raise_for_status()  # Raise an error for bad responses
-        soup = BeautifulSoup(response.content, 'html.parser')
+        content = await http_client.get_bytes(pdf_source) # raises an error for bad responses
+        soup = BeautifulSoup(content, 'html.parser')
         pdf_links = soup.find_all('a', href=True)
         
         for link in pdf_links:
@@ -17,52 +22,146 @@ def get_latest_pdf_link(pdf_source):
         
         return None  # Return None if no PDF link is found
 
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f"An error occurred while fetching the PDF source: {e}")
         return None
 
-def download_pdf_as_bytes(pdf_url):
+async def download_pdf(pdf_url, http_client, pdf_cache=None):
+    """Streams the PDF into a SpooledPdf (in memory when small, in a temporary file otherwise, see src/connector/pdf_spool.py).
+    The caller closes it once the PDF is processed.
+    """
+    pdf = None
     try:
-        response = requests.get(pdf_url)
-        response.raise_for_status()  # Raise an error for bad responses
-        return io.BytesIO(response.content)
+        if pdf_cache is not None:
+            return await pdf_cache.fetch(pdf_url, http_client) # conditional request, unchanged pdfs come from disk
+        pdf = SpooledPdf()
+        await http_client.download(pdf_url, pdf) # raises an error for bad responses
+        return pdf
         
-    except requests.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError, PdfTooLargeError) as e:
         print(f"An error occurred while downloading the PDF: {e}")
+        if pdf is not None:
+            pdf.close()
         return None
 
-def extract_text_from_page1(pdf_data):
+# text showing operators of a page content stream: [(..) kerning (..)] TJ, and (..) Tj / ' / "
+PDF_TEXT_OPERATOR = re.compile(rb'\[((?:[^\]\\]|\\.)*)\]\s*TJ|(\((?:[^()\\]|\\.)*\))\s*(?:Tj|\'|")', re.S)
+PDF_STRING = re.compile(rb'\((?:[^()\\]|\\.)*\)', re.S)
+PDF_STRING_ESCAPE = re.compile(rb'\\([nrtbf()\\\n]|[0-7]{1,3})')
+PDF_STRING_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f', b'(': b'(', b')': b')', b'\\': b'\\', b'\n': b''}
 
-    extracted_texts = []
+def unescape_pdf_string(match):
+    escape = match.group(1)
+    return PDF_STRING_ESCAPES.get(escape) or bytes([int(escape, 8) & 0xFF])
+
+def content_stream_text(content):
+    """
+    Returns the literal strings shown by the text operators of a decoded page content stream, one line per operator.
+    There is no layout analysis and no font decoding (hex strings are skipped), so this is only meant for
+    cheap marker lookups; use BulletinPdf.page_text for real text.
+    """
+    lines = []
+    for match in PDF_TEXT_OPERATOR.finditer(content):
+        strings = PDF_STRING.findall(match.group(1)) if match.group(1) is not None else [match.group(2)]
+        lines.append(b''.join(PDF_STRING_ESCAPE.sub(unescape_pdf_string, string[1:-1]) for string in strings))
+    return b'\n'.join(lines).decode('latin-1')
+
+class BulletinPdf:
+    """
+    A bulletin PDF that is parsed once and shared by every stage of the pipeline.
     
-    try:
-        with pdfplumber.open(pdf_data) as pdf:
-            page_text = pdf.pages[0].extract_text()
-            extracted_texts.append(page_text)
+    The PDF is opened with pdfplumber a single time, page text is extracted lazily (only for the pages
+    asked for) and cached, and the same bytes / file path is handed to the table extractor. Cheap marker
+    lookups read the raw page content streams with PyPDF2 instead (page_stream_text).
+    Page numbers are 1-based, same as tabula's `pages` argument.
     
-    except Exception as e:
-        print(f"An error occurred while extracting text from PDF: {e}")
-        return None
+    Parameters:
+    - pdf_data: The PDF as raw bytes, a BytesIO object or a file path. A file is memory mapped, so processes
+      reading the same file share its pages instead of each holding a copy.
+    """
 
-    return extracted_texts
+    def __init__(self, pdf_data):
+        if isinstance(pdf_data, (str, os.PathLike)):
+            self.path = os.fspath(pdf_data)
+            self.content = None
+        elif isinstance(pdf_data, io.BytesIO):
+            self.path = None
+            self.content = pdf_data.getvalue() # independent of the current stream position
+        else:
+            self.path = None
+            self.content = bytes(pdf_data)
+        self._pdf = None
+        self._reader = None
+        self._mmap = None
+        self._page_texts = {}
+        self._page_stream_texts = {}
 
-def extract_text_from_page2(pdf_data):
+    def __enter__(self):
+        return self
 
-    extracted_texts = []
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-    try:
-        with pdfplumber.open(pdf_data) as pdf:
-            page_text = pdf.pages[1].extract_text()
-            extracted_texts.append(page_text)
+    @property
+    def pdf(self):
+        if self._pdf is None:
+            self._pdf = pdfplumber.open(self.path if self.path is not None else io.BytesIO(self.content))
+        return self._pdf
 
-    except Exception as e:
-        print(f"An error occurred while extracting text from PDF: {e}")
-        return None
+    @property
+    def reader(self):
+        if self._reader is None:
+            self._reader = PdfReader(self.file_view() if self.path is not None else io.BytesIO(self.content))
+        return self._reader
+
+    def file_view(self):
+        # PyPDF2 reads a file given by path fully into memory, a memory map is read in place
+        if self._mmap is None:
+            with open(self.path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
 
-    return extracted_texts
+    @property
+    def page_count(self) -> int:
+        return len(self.reader.pages)
+
+    def page_stream_text(self, page_number: int) -> str:
+        """Returns the strings of the given page's raw content stream (see content_stream_text), a small fraction
+        of the cost of page_text
+        """
+        if page_number not in self._page_stream_texts:
+            contents = self.reader.pages[page_number - 1].get_contents()
+            self._page_stream_texts[page_number] = content_stream_text(contents.get_data()) if contents is not None else ''
+        return self._page_stream_texts[page_number]
+
+    def page_text(self, page_number: int) -> str:
+        """Returns the text of the given page, extracting it on first use
+        """
+        if page_number not in self._page_texts:
+            # the parsed page stays cached on self.pdf, so the pdfplumber table engine can reuse it
+            self._page_texts[page_number] = self.pdf.pages[page_number - 1].extract_text() or ''
+        return self._page_texts[page_number]
+
+    def page_lines(self, page_number: int) -> list[str]:
+        return self.page_text(page_number).split('\n')
+
+    def close(self):
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+        self._reader = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
 
 if __name__ == "__main__":
 
+    from src.connector.http_client import HttpClient
+
     pdf_source = 'https://www.harti.gov.lk/index.php/en/market-information/data-food-commodities-bulletin' 
 
-    link = get_latest_pdf_link(pdf_source)
+    async def print_latest_pdf_link():
+        async with HttpClient() as http_client:
+            print(await get_latest_pdf_link(pdf_source, http_client))
+
+    asyncio.run(print_latest_pdf_link())
@@ -0,0 +1,159 @@
+# link_discovery.py
+# Discovery of the bulletin PDF links on the Harti listing, which lists the newest bulletin first and may be
+# spread over several pages.
+#
+# In the incremental mode (default) a run first sends a conditional request for the first listing page (ETag /
+# Last-Modified of the last run). If the server answers 304, or the page hash or its newest link did not change,
+# there is nothing new and the run ends before the processed pdf tracker is even downloaded. Otherwise the listing
+# pages are walked newest first and the walk stops at the first link that was already processed.
+import hashlib
+import logging
+from urllib.parse import urljoin
+from src.configuration.configuration import LINK_DISCOVERY_MODE, LINK_DISCOVERY_MAX_PAGES
+
+# only the anchors (and <link rel="next"> of the head) are parsed, the rest of the listing page is skipped
+LISTING_TAGS = ['a', 'link']
+NEXT_PAGE_TEXTS = {'next', '>', '»', '›', 'next >', 'next »'}
+
+def is_next_page_link(tag):
+    if 'next' in (tag.get('rel') or []):
+        return True
+    if tag.name != 'a':
+        return False
+    # Joomla pagination: <a title="Next" class="pagenav">Next</a> or <a aria-label="Go to next page">
+    title = (tag.get('title') or '').strip().lower()
+    aria_label = (tag.get('aria-label') or '').strip().lower()
+    return title == 'next' or 'next page' in aria_label or tag.get_text(strip=True).lower() in NEXT_PAGE_TEXTS
+
+def parse_listing_page(content, page_url):
+    """
+    Parses the anchors of one listing page.
+
+    Parameters:
+    - content: The HTML of the page.
+    - page_url: The URL of the page, relative links are resolved against it.
+
+    Returns:
+    - The pdf links of the page in page order (newest first), without duplicates.
+    - The URL of the next listing page, or None on the last page.
+    """
+    # imported here, a run whose listing did not change (304 / same hash) never parses html
+    from bs4 import BeautifulSoup, SoupStrainer
+    soup = BeautifulSoup(content, 'html.parser', parse_only=SoupStrainer(LISTING_TAGS))
+    pdf_links = {}
+    next_page_url = None
+    for tag in soup.find_all(LISTING_TAGS, href=True):
+        if tag.name == 'a' and '.pdf' in tag['href']:
+            pdf_links[urljoin(page_url, tag['href']).strip()] = None
+        elif next_page_url is None and is_next_page_link(tag):
+            next_page_url = urljoin(page_url, tag['href'])
+    return list(pdf_links), next_page_url
+
+class LinkDiscovery:
+    """
+    Finds the bulletin links that have not been processed yet.
+
+    Usage:
+        discovery = LinkDiscovery(pdf_source_url, http_client, download_listing_state())
+        if await discovery.listing_changed():                          # before the tracker is loaded
+            new_pdf_links = await discovery.new_pdf_links(processed_pdfs)   # newest first
+            ...
+            upload_listing_state(discovery.listing_state())           # once the new links are processed
+        elif discovery.listing_state_outdated():                       # same bulletins, new ETag / content
+            upload_listing_state(discovery.listing_state())
+    """
+
+    def __init__(self, pdf_source, http_client, previous_state=None, mode=LINK_DISCOVERY_MODE, max_pages=LINK_DISCOVERY_MAX_PAGES):
+        if mode not in ('incremental', 'full'):
+            raise ValueError(f"Unknown link discovery mode '{mode}', expected 'incremental' or 'full'")
+        self.pdf_source = pdf_source
+        self.http_client = http_client
+        self.previous_state = previous_state or {}
+        self.mode = mode
+        self.max_pages = max(max_pages, 1)
+        self.etag = None
+        self.last_modified = None
+        self.sha256 = None
+        self.first_page_links = []
+        self.newest_link = None
+        self.next_page_url = None
+
+    @property
+    def incremental(self):
+        return self.mode == 'incremental'
+
+    async def listing_changed(self):
+        """Fetches the first listing page. Returns False if, in the incremental mode, it has not changed since the last run
+        """
+        headers = {}
+        if self.incremental:
+            if self.previous_state.get('etag'):
+                headers['If-None-Match'] = self.previous_state['etag']
+            if self.previous_state.get('last_modified'):
+                headers['If-Modified-Since'] = self.previous_state['last_modified']
+
+        status, response_headers, content = await self.http_client.get(self.pdf_source, headers=headers)
+        if status == 304:
+            logging.info("Bulletin listing not modified since the last run")
+            return False
+        self.etag = response_headers.get('ETag')
+        self.last_modified = response_headers.get('Last-Modified')
+        self.sha256 = hashlib.sha256(content).hexdigest()
+        if self.incremental and self.sha256 == self.previous_state.get('sha256'):
+            logging.info("Bulletin listing unchanged since the last run (same content hash)")
+            # the page is not parsed, its newest link is the one of the last run
+            self.newest_link = self.previous_state.get('newest_link')
+            return False
+
+        self.first_page_links, self.next_page_url = parse_listing_page(content, self.pdf_source)
+        self.newest_link = self.first_page_links[0] if self.first_page_links else None
+        if self.incremental and self.first_page_links and self.first_page_links[0] == self.previous_state.get('newest_link'):
+            logging.info(f"Newest bulletin unchanged since the last run: {self.first_page_links[0]}")
+            return False
+        return True
+
+    async def new_pdf_links(self, processed_pdfs):
+        """
+        Walks the listing pages (starting with the first page fetched by listing_changed) and collects the links that are
+        not in processed_pdfs. The incremental mode stops at the first processed link, the full mode reads every page.
+
+        Returns:
+        - The new pdf links, newest first.
+        """
+        new_links = {}
+        page_links, next_page_url = self.first_page_links, self.next_page_url
+        visited_pages = {self.pdf_source}
+        while True:
+            for pdf_link in page_links:
+                if pdf_link not in processed_pdfs:
+                    new_links[pdf_link] = None
+                elif self.incremental:
+                    logging.info(f"Reached an already processed PDF link, stopping the discovery: {pdf_link}")
+                    return list(new_links)
+
+            if next_page_url is None or next_page_url in visited_pages:
+                break
+            if len(visited_pages) >= self.max_pages:
+                logging.warning(f"Stopped the link discovery after {self.max_pages} listing pages")
+                break
+            visited_pages.add(next_page_url)
+            content = await self.http_client.get_bytes(next_page_url)
+            page_links, next_page_url = parse_listing_page(content, next_page_url)
+        return list(new_links)
+
+    def listing_state(self):
+        """The state of the listing to compare the next run against"""
+        return {
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'sha256': self.sha256,
+            'newest_link': self.newest_link,
+        }
+
+    def listing_state_outdated(self):
+        """After listing_changed returned False: True if the listing was downloaded (not a 304) and its state differs from
+        the last run's (eg: a new ETag, or new content with the same newest bulletin). The state is then saved without
+        processing anything, so the next run can use the conditional request / hash shortcuts again.
+        """
+        state = self.listing_state()
+        return self.sha256 is not None and state != {name: self.previous_state.get(name) for name in state}
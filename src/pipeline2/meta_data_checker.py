@@ -1,8 +1,48 @@
 # Riverse_meta_data_reader.py
 import re
+from src.configuration.configuration import metadata_line1, wholesale_table_marker
 
 def find_line_with_metadata(lines, metadata_line):
-    for line in lines:
-        if re.search(re.escape(metadata_line), line):
-            return False
-    return True
+    """Returns True if one of the lines contains metadata_line
+    """
+    return any(metadata_line in line for line in lines)
+
+def contains_marker(text, marker):
+    # whitespace is ignored, the raw content stream text has no reliable spaces
+    return re.sub(r'\s+', '', marker) in re.sub(r'\s+', '', text)
+
+def locate_wholesale_table_pages(pdf, table_marker=wholesale_table_marker, metadata_line=metadata_line1):
+    """
+    Finds the pages of the bulletin that hold the wholesale price table.
+    
+    Every page is checked on the strings of its raw content stream: a table page starts with the table_marker
+    header and is not the "Wholesale Prices of Rice & Subsidiary Food Crops" (metadata_line) page.
+    If no page matches (eg: text drawn with hex strings), the full text of pages 1 and 2 is used instead, and the
+    first of them without the metadata line is taken.
+    
+    Parameters:
+    - pdf: A BulletinPdf.
+    - table_marker: Text that marks the wholesale price table page.
+    - metadata_line: Text that marks the rice & subsidiary food crops page.
+    
+    Returns:
+    - The 1-based page numbers, [] if the table could not be located.
+    """
+    page_numbers = []
+    for page_number in range(1, pdf.page_count + 1):
+        text = pdf.page_stream_text(page_number)
+        if contains_marker(text, table_marker) and not contains_marker(text, metadata_line):
+            page_numbers.append(page_number)
+    if page_numbers:
+        return page_numbers
+
+    for page_number in range(1, min(pdf.page_count, 2) + 1):
+        if not find_line_with_metadata(pdf.page_lines(page_number), metadata_line):
+            return [page_number]
+    return []
+
+def locate_wholesale_table_page(pdf, table_marker=wholesale_table_marker, metadata_line=metadata_line1):
+    """Returns the first page holding the wholesale price table (see locate_wholesale_table_pages), or None
+    """
+    page_numbers = locate_wholesale_table_pages(pdf, table_marker, metadata_line)
+    return page_numbers[0] if page_numbers else None
@@ -0,0 +1,100 @@
+# pdf_processing.py
+# CPU bound part of the pipeline (pdf parsing, table extraction and data transformation).
+# Kept as a top level function in its own module so it can be sent to a process pool.
+import logging
+import pandas as pd
+from src.pipeline2.meta_data_checker import locate_wholesale_table_pages
+from src.pipeline2.get_pdfdata import BulletinPdf
+from src.logHandling import init_worker_logging
+from src.utils.metrics import PdfMetrics, profiled, start_tracemalloc_if_enabled
+from src.pipeline2.extract_table_from_pdf_to_df import table_extraction_engine, extract_tables_by_page
+from src.pipeline2.cleaning_column_values import clean_dataframe
+from src.pipeline2.data_transformation import (
+    rename_columns_before_dot,
+    transform_food_df,
+    rename_first_column,
+    update_item_names,
+    split_and_convert_value_column,
+    insert_database_write_date,
+    drop_rows_with_missing_values_in_value_column,preprocess_dataframe,convert_dates,add_page_number_column
+)
+
+def init_worker(log_queue):
+    """Process pool initializer: forwards worker logs to the parent and warms up the table extraction engine
+    (starts tabula's JVM) once per worker process
+    """
+    init_worker_logging(log_queue)
+    start_tracemalloc_if_enabled()
+    table_extraction_engine.start()
+
+def transform_page_table(food_df, page_number, metrics=None):
+    """Reshapes the raw wholesale price table of one page into long format (one row per date, market and item), tagged with its page
+    """
+    metrics = metrics or PdfMetrics()
+    food_df = metrics.measure('clean_dataframe', clean_dataframe, food_df, page=page_number)
+    food_df = metrics.measure('rename_columns_before_dot', rename_columns_before_dot, food_df, page=page_number)
+    food_df = metrics.measure('rename_first_column', rename_first_column, food_df, page=page_number)
+    food_df = metrics.measure('preprocess_dataframe', preprocess_dataframe, food_df, page=page_number)
+    food_df = metrics.measure('convert_dates', convert_dates, food_df, page=page_number)
+    food_df = metrics.measure('transform_food_df', transform_food_df, food_df, page=page_number)
+    food_df = add_page_number_column(food_df, page_number)
+    return food_df
+
+def extract_and_transform_pdf(pdf_content: bytes, pdf_link: str = '', metrics=None):
+    """
+    Extracts the wholesale price table from a downloaded bulletin and runs the transformation chain on it.
+    
+    Parameters:
+    - pdf_content: The PDF as raw bytes or a file path.
+    - pdf_link: The link the PDF was downloaded from (only used for logging).
+    - metrics: Optional PdfMetrics the stage timings are recorded on.
+    
+    Returns:
+    - The transformed DataFrame, or None if the wholesale price table could not be located.
+    """
+    metrics = metrics or PdfMetrics(pdf_link)
+
+    # The PDF is parsed once; the table pages are located on the raw page content streams
+    with BulletinPdf(pdf_content) as pdf:
+
+        page_numbers = metrics.measure('locate_table', locate_wholesale_table_pages, pdf)
+        if not page_numbers:
+            logging.error(f">>>> Wholesale price table not found in {pdf_link}. Aborting data extraction. <<<<")
+            return None
+
+        pages = ', '.join(map(str, page_numbers))
+        logging.info(f">>>> Wholesale price table found on Page {pages}, proceeding with data extraction from Page {pages}... <<<<")
+        with metrics.stage('table_extraction', engine=table_extraction_engine.name) as record:
+            tables_by_page = extract_tables_by_page(pdf, page_numbers)
+            record['rows'] = sum(len(table) for table in tables_by_page.values())
+        if not tables_by_page:
+            logging.error(f">>>> No table could be read from Page {pages} of {pdf_link}. Aborting data extraction. <<<<")
+            return None
+    
+    # Data transformation
+    logging.info(">>>> Staring data transformation <<<<")
+
+    # every page table has its own date header, so it is reshaped on its own and tagged with its page
+    food_df = pd.concat([transform_page_table(table, page_number, metrics) for page_number, table in tables_by_page.items()], ignore_index=True)
+
+    # the row wise steps run once for all pages
+    food_df = metrics.measure('update_item_names', update_item_names, food_df)
+    food_df = metrics.measure('split_and_convert_value_column', split_and_convert_value_column, food_df)
+    food_df = metrics.measure('insert_database_write_date', insert_database_write_date, food_df)
+    food_df = metrics.measure('drop_rows_with_missing_values_in_value_column', drop_rows_with_missing_values_in_value_column, food_df)
+    food_df = metrics.measure('add_page_number_column', add_page_number_column, food_df)
+    logging.info(">>>> Data transformation finished <<<<")
+
+    return food_df
+
+def extract_and_transform_pdf_with_metrics(pdf_content: bytes, pdf_link: str = ''):
+    """
+    Process pool entry point: extract_and_transform_pdf, profiled if enabled for the run.
+    
+    Returns:
+    - (the transformed DataFrame or None, the stage metrics dict of this PDF)
+    """
+    metrics = PdfMetrics(pdf_link)
+    with profiled(metrics):
+        food_df = extract_and_transform_pdf(pdf_content, pdf_link, metrics)
+    return food_df, metrics.to_dict()
@@ -0,0 +1,174 @@
+# metrics.py
+# Per stage instrumentation of the pipeline: wall time, CPU time, memory and row counts of every stage of every PDF,
+# collected into one metrics document per run (uploaded next to the log file, see src/connector/blob.py).
+#
+# Optional profiling per run with the profile_mode setting:
+# - 'cprofile': every PDF's extraction / transformation is run under cProfile and its top functions are added to the metrics
+# - 'tracemalloc': every stage also records the peak of the memory traced by tracemalloc (slower, but exact per stage)
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from src.configuration.configuration import PROFILE_MODE
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+PROFILE_TOP_FUNCTIONS = 25
+
+def profile_modes(profile_mode=PROFILE_MODE):
+    return {mode.strip() for mode in profile_mode.split(',') if mode.strip()}
+
+def start_tracemalloc_if_enabled(profile_mode=PROFILE_MODE):
+    if 'tracemalloc' in profile_modes(profile_mode) and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def current_rss_mb():
+    # /proc is only there on linux, the metrics just leave the value out elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / 1e6 # KiB on linux, MB like current_rss_mb
+
+class PdfMetrics:
+    """
+    Stage records of one PDF.
+
+    Usage:
+        metrics = PdfMetrics(pdf_link)
+        with metrics.stage('download') as record:
+            ...
+            record['bytes'] = len(content)
+        food_df = metrics.measure('clean_dataframe', clean_dataframe, food_df)   # also records len(result) as rows
+
+    CPU time is the CPU time of the whole process, so for stages of concurrent PDFs on the event loop it also
+    includes the work of the other PDFs; it is exact for the stages run in the process pool.
+
+    Memory per stage: rss_mb is the RSS when the stage ends, peak_rss_mb the process' peak RSS (ru_maxrss) when it
+    ends and peak_rss_growth_mb how much the stage raised that peak (0 if it stayed below an earlier peak of the
+    process, eg: a previous PDF in the same pool worker). The peak_rss_mb of the PDF is the highest peak_rss_mb of
+    its stages, over all the processes they ran in (see merge).
+    """
+
+    def __init__(self, pdf_link=''):
+        self.pdf_link = pdf_link
+        self.stages = []
+        self.profile = None
+        self.peak_rss_mb = None
+
+    @contextmanager
+    def stage(self, name, **fields):
+        record = {'stage': name}
+        record.update(fields)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        start_peak_rss = peak_rss_mb()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - start_wall
+            record['cpu_seconds'] = time.process_time() - start_cpu
+            record['rss_mb'] = current_rss_mb()
+            record['peak_rss_mb'] = peak_rss_mb()
+            if record['peak_rss_mb'] is not None:
+                record['peak_rss_growth_mb'] = record['peak_rss_mb'] - start_peak_rss
+                self.peak_rss_mb = max(self.peak_rss_mb or 0, record['peak_rss_mb'])
+            if tracing:
+                record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+            self.stages.append(record)
+
+    def measure(self, name, function, *args, **fields):
+        """Runs function(*args) as a stage and returns its result, recording len(result) as the row count"""
+        with self.stage(name, **fields) as record:
+            result = function(*args)
+            if hasattr(result, '__len__'):
+                record['rows'] = len(result)
+        return result
+
+    def to_dict(self):
+        return {'pdf_link': self.pdf_link, 'stages': self.stages, 'peak_rss_mb': self.peak_rss_mb, 'profile': self.profile}
+
+    def merge(self, metrics_dict):
+        """Adds the stages (and the peak RSS) recorded for the same PDF in another process (eg: the process pool)"""
+        if metrics_dict:
+            self.stages.extend(metrics_dict['stages'])
+            self.profile = metrics_dict.get('profile') or self.profile
+            if metrics_dict.get('peak_rss_mb') is not None:
+                self.peak_rss_mb = max(self.peak_rss_mb or 0, metrics_dict['peak_rss_mb'])
+
+@contextmanager
+def profiled(metrics, profile_mode=PROFILE_MODE):
+    """Runs the block under cProfile if enabled for this run, storing the top functions (by cumulative time) on metrics.profile"""
+    if 'cprofile' not in profile_modes(profile_mode):
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        metrics.profile = output.getvalue()
+
+class RunMetrics:
+    """
+    Metrics document of one run: the stage records of every PDF plus per stage totals.
+    """
+
+    def __init__(self, profile_mode=PROFILE_MODE):
+        self.started = datetime.now()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.profile_mode = profile_mode
+        self.startup = {}
+        self.pdfs = []
+
+    def add(self, pdf_metrics):
+        self.pdfs.append(pdf_metrics.to_dict())
+
+    def stage_totals(self):
+        totals = {}
+        for pdf in self.pdfs:
+            for record in pdf['stages']:
+                total = totals.setdefault(record['stage'], {'count': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rows': 0})
+                total['count'] += 1
+                total['wall_seconds'] += record['wall_seconds']
+                total['cpu_seconds'] += record['cpu_seconds']
+                total['rows'] += record.get('rows', 0)
+        return totals
+
+    def to_document(self):
+        return {
+            'run_started': self.started.isoformat(),
+            'run_wall_seconds': time.perf_counter() - self.start_wall,
+            'run_cpu_seconds': time.process_time() - self.start_cpu,
+            'peak_rss_mb': peak_rss_mb(),
+            'profile_mode': self.profile_mode,
+            'startup': self.startup,
+            'pdf_count': len(self.pdfs),
+            'stage_totals': self.stage_totals(),
+            'pdfs': self.pdfs,
+        }
+
+    def log_summary(self):
+        totals = sorted(self.stage_totals().items(), key=lambda item: item[1]['wall_seconds'], reverse=True)
+        for name, total in totals:
+            logging.info(f"stage {name}: {total['count']}x, {total['wall_seconds']:.2f}s wall, {total['cpu_seconds']:.2f}s cpu, {total['rows']} rows")